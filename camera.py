@@ -1,31 +1,115 @@
 import sys
 import os
 script_directory = os.path.dirname(os.path.realpath(__file__))
-#sys.path.insert(0, script_directory + '/python-onvif-zeep/onvif')
+sys.path.insert(0, script_directory + '/python-onvif-zeep')
 sys.path.insert(0, script_directory + '/python-rtsp-client')
 wsdl = script_directory + '/python-onvif-zeep/wsdl'
 
 from onvif import ONVIFCamera
-from rtsp import RTSPClient
+from rtsp import AsyncRTSPClient, RTSPError
 #import socks
+import asyncio
 import time
 import re
+import struct
 import datetime
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse # for python < 3.0
 timezone = time.timezone / 3600.0
 
 class Profile(object):
-    pass
+    __slots__ = ('name', 'token', 'encoding', 'resolution_W', 'resolution_H',
+                 'quality', 'framerate_limit', 'encoding_interval', 'bitrate_limit',
+                 'rtsp_uri', 'InvalidAfterConnect', 'InvalidAfterReboot', 'Timeout',
+                 'uri_expires')
+
+    def __init__(self, name=None, token=None, encoding=None, resolution_W=None,
+                 resolution_H=None, quality=None, framerate_limit=None,
+                 encoding_interval=None, bitrate_limit=None):
+        self.name = name
+        self.token = token
+        self.encoding = encoding
+        self.resolution_W = resolution_W
+        self.resolution_H = resolution_H
+        self.quality = quality
+        self.framerate_limit = framerate_limit
+        self.encoding_interval = encoding_interval
+        self.bitrate_limit = bitrate_limit
+        self.rtsp_uri = None
+        self.InvalidAfterConnect = False
+        self.InvalidAfterReboot = True
+        self.Timeout = None
+        self.uri_expires = 0 # time.monotonic() after which the stream uri is refetched
+
+def onvif_datetime(value):
+    '''Naive datetime of an ONVIF tt:DateTime, None when missing or invalid'''
+    try:
+        return datetime.datetime(value.Date.Year, value.Date.Month, value.Date.Day,
+                                 value.Time.Hour, value.Time.Minute, value.Time.Second)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def duration_seconds(duration):
+    '''Seconds in an xs:duration as returned by zeep (timedelta or isodate.Duration)'''
+    if duration is None:
+        return 0
+    if hasattr(duration, 'totimedelta'):
+        duration = duration.totimedelta(start=datetime.datetime.now())
+    return duration.total_seconds()
+
+class MediaFlow(object):
+    '''Counts the interleaved RTP packets of one channel and tracks their
+       timestamps, looking at the 12 byte RTP header only'''
+    __slots__ = ('max_packets', 'packets', 'first_timestamp', 'last_timestamp')
+
+    def __init__(self, max_packets):
+        self.max_packets = max_packets
+        self.packets = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def on_packet(self, channel, data):
+        if len(data) < 12 or self.full():
+            return
+        self.packets += 1
+        self.last_timestamp = struct.unpack_from('!I', data, 4)[0]
+        if self.first_timestamp is None:
+            self.first_timestamp = self.last_timestamp
+
+    def full(self):
+        return self.packets >= self.max_packets
+
+    def advancing(self):
+        return self.first_timestamp is not None and self.last_timestamp != self.first_timestamp
 
 class Camera():
     ONVIF_HEALTHY = 'ONVIF OK'
     ONVIF_UNHEALTHY = 'ONVIF ERROR'
     RTSP_HEALTHY = 'RTSP OK'
     RTSP_UNHEALTHY = 'RTSP ERROR'
+    RTSP_STALLED = 'RTSP STALLED'
     RTSP_CONNECTING = 'RTSP CONNECTING'
     ONVIF_CONNECTING = 'ONVIF CONNECTING'
     COMPLETE_BUFFER = 'COMPLETE_BUFFER'
     RTSP_TIMEOUT = 15 #Seconds
-    def __init__(self, id=None, name=None, ip=None, onvif=None, rtsp=None, username=None, password=None, socks=None):
+    # Health check tiers, cheapest first. A tier runs when its interval has
+    # elapsed, None disables it. A healthy camera usually costs one TCP handshake.
+    # The media tier (SETUP/PLAY and RTP counting) is opt-in per camera.
+    # With persistent_rtsp the session tier replaces tcp, options and describe.
+    TIERS = ('session', 'tcp', 'options', 'describe', 'media')
+    TIER_INTERVALS = {'session': None, 'tcp': 0, 'options': 300, 'describe': 900, 'media': None} #Seconds
+    TIER_TIMEOUTS = {'session': 15, 'tcp': 5, 'options': 10, 'describe': 15, 'media': 20} #Seconds
+    KEEPALIVE_MAX_MISSED = 1 #Unanswered keepalives that fail the session tier
+    MEDIA_FLOW_WINDOW = 3 #Seconds of RTP watched by the media tier
+    MEDIA_FLOW_MAX_PACKETS = 200 #Stop counting early, bounds the CPU spent per camera
+    MEDIA_FLOW_MIN_PACKETS = 5
+    TEARDOWN_TIMEOUT = 1 #Seconds, the media verdict is known before TEARDOWN
+    MEDIA_CACHE_TTL = 3600 #Seconds profiles are reused before GetProfiles is called again
+    REBOOT_CLOCK_JUMP = 60 #Seconds the camera clock may drift from ours between probes
+    def __init__(self, id=None, name=None, ip=None, onvif=None, rtsp=None, username=None, password=None, socks=None, media_flow_interval=None,
+                 persistent_rtsp=False):
         self.id = id
         self.name = name or ''
         self.ip = ip
@@ -34,7 +118,17 @@ class Camera():
         self.username = username
         self.password = password
         self.rtsp_uri = None
-        self.profiles = []
+        self.profiles = () # Replaced as a whole on refresh, never appended to
+        self.profiles_expire = 0
+        self.clock_offset = None # Camera clock minus ours at the last probe, seconds
+        self.tier_next = {}
+        self.tier_intervals = dict(self.TIER_INTERVALS)
+        if media_flow_interval:
+            self.tier_intervals['media'] = media_flow_interval
+        if persistent_rtsp:
+            self.tier_intervals.update(session=0, tcp=None, options=None, describe=None)
+        self.rtsp_session = None
+        self.rtsp_session_uri = None
         self.socks_transport = None
         self.socks = False
         if socks:
@@ -51,29 +145,159 @@ class Camera():
 
             self.socks_transport = CustomTransport(timeout=10, proxies=proxies)
         self.camera = None
-    def watchdog(self, observer, disposable):
+    async def watchdog(self):
+        '''Runs the cheapest health checks that are due and returns the list
+           of conditions seen. Any failing tier escalates to the full
+           ONVIF + DESCRIBE check, whose verdict is the one acted upon'''
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        profile = self.profiles[0] if self.profiles else None
+        if profile is None or profile.rtsp_uri is None or \
+                time.monotonic() >= profile.uri_expires or self.socks:
+            return await self.full_check()
+        for tier in self.TIERS:
+            interval = self.tier_intervals[tier]
+            if interval is None or now < self.tier_next.get(tier, 0):
+                continue
+            try:
+                ok = await asyncio.wait_for(getattr(self, 'check_' + tier)(profile.rtsp_uri),
+                                            self.TIER_TIMEOUTS[tier])
+            except (asyncio.TimeoutError, OSError, RTSPError):
+                ok = False
+            if not ok:
+                condition = await self.full_check()
+                if tier == 'media' and self.RTSP_HEALTHY in condition:
+                    # DESCRIBE answers but no video flows: frozen stream
+                    condition[condition.index(self.RTSP_HEALTHY)] = self.RTSP_STALLED
+                return condition
+            self.tier_next[tier] = now + interval
+        return [self.RTSP_HEALTHY, self.COMPLETE_BUFFER]
+
+    async def full_check(self):
+        '''Probes ONVIF and RTSP DESCRIBE. Blocking ONVIF/RTSP calls run on
+           the loop's default executor'''
+        loop = asyncio.get_event_loop()
+        condition = [self.ONVIF_CONNECTING]
+        fresh = await loop.run_in_executor(None, self.probe_information)
+        condition.append(self.ONVIF_HEALTHY)
+        condition.append(self.RTSP_CONNECTING)
+        ok = await self._describe_first_profile()
+        if not ok and not fresh:
+            # The cached stream uri may be stale, e.g. profiles changed or the
+            # camera rebooted unnoticed. Fetch it again before blaming RTSP
+            self.invalidate_media()
+            await loop.run_in_executor(None, self.probe_information)
+            ok = await self._describe_first_profile()
+        if ok:
+            condition.append(self.RTSP_HEALTHY)
+            # Every tier up to DESCRIBE has just been covered
+            for tier in ('options', 'describe'):
+                if self.tier_intervals[tier]:
+                    self.tier_next[tier] = loop.time() + self.tier_intervals[tier]
+        else:
+            condition.append(self.RTSP_UNHEALTHY)
+        condition.append(self.COMPLETE_BUFFER)
+        return condition
+
+    async def _describe_first_profile(self):
+        try:
+            return await asyncio.wait_for(self.check_describe(self.profiles[0].rtsp_uri),
+                                          Camera.RTSP_TIMEOUT)
+        except (asyncio.TimeoutError, OSError, RTSPError):
+            return False
+
+    async def check_tcp(self, uri):
+        '''Tier 1: the RTSP port accepts a TCP connection'''
+        parsed = urlparse(uri)
+        reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 554)
+        writer.close()
+        return True
+
+    async def check_options(self, uri):
+        '''Tier 2: the RTSP server answers OPTIONS'''
+        return await self._rtsp_request(uri, 'options')
+
+    async def check_describe(self, uri):
+        '''Tier 3: the RTSP server describes the stream'''
+        return await self._rtsp_request(uri, 'describe')
+
+    async def check_session(self, uri):
+        '''Persistent mode: one RTSP session per camera, DESCRIBE then SETUP
+           interleaved over TCP but never PLAY, stays open and is kept alive
+           with GET_PARAMETER/OPTIONS carrying its Session. Healthy while
+           keepalives are answered with 2xx, so a probe costs no network I/O'''
+        session = self.rtsp_session
+        if session is not None:
+            if self.rtsp_session_uri == uri and not session.closed and \
+                    session.keepalive_missed < self.KEEPALIVE_MAX_MISSED:
+                return True
+            self.close_rtsp_session()
+            if self.rtsp_session_uri == uri:
+                # Dropped connection or unanswered keepalive
+                return False
+        session = self.rtsp_client(uri)
         try:
-            observer.on_next(self.ONVIF_CONNECTING)
-            self.probe_information()
-            observer.on_next(self.ONVIF_HEALTHY)
-            uri = self.profiles[0].rtsp_uri
-            observer.on_next(self.RTSP_CONNECTING)
-            rtsp = self.rtsp_connect(uri)
-            rtsp.do_describe()
-            i = 0
-
-            while rtsp.state != 'describe':
-                time.sleep(0.1)
-                i+=1
-                if i==Camera.RTSP_TIMEOUT*10:
-                    break
-            if rtsp.state != 'describe':
-                observer.on_next(self.RTSP_UNHEALTHY)
-            else:
-                observer.on_next(self.RTSP_HEALTHY)
-            observer.on_next(self.COMPLETE_BUFFER)
-        except Exception as e:
-            observer.on_error(str(e))
+            await session.connect()
+            self._connected(uri)
+            session.TRANSPORT_TYPE_LIST = ['rtp_avp_tcp']
+            if (await session.describe()).status != 200 or \
+                    (await session.setup(0 if session.track_id_lst else None)).status != 200:
+                session.close()
+                return False
+        except:
+            session.close()
+            raise
+        session.start_keepalive()
+        self.rtsp_session = session
+        self.rtsp_session_uri = uri
+        return True
+
+    def close_rtsp_session(self):
+        '''Closes the persistent session, returned to await its wait_closed()'''
+        session, self.rtsp_session = self.rtsp_session, None
+        if session is not None:
+            session.close()
+        return session
+
+    async def check_media(self, uri):
+        '''Tier 4: RTP actually flows. Runs SETUP/PLAY interleaved over the
+           RTSP connection and watches packets and RTP timestamps for at most
+           MEDIA_FLOW_WINDOW seconds or MEDIA_FLOW_MAX_PACKETS packets'''
+        loop = asyncio.get_event_loop()
+        flow = MediaFlow(self.MEDIA_FLOW_MAX_PACKETS)
+        async with self.rtsp_client(uri) as rtsp:
+            self._connected(uri)
+            rtsp.set_channel_callback(0, flow.on_packet)
+            if (await rtsp.describe()).status != 200:
+                return False
+            rtsp.TRANSPORT_TYPE_LIST = ['rtp_avp_tcp']
+            # Without a=control in the SDP the stream itself is set up
+            if (await rtsp.setup(0 if rtsp.track_id_lst else None)).status != 200:
+                return False
+            if (await rtsp.play()).status != 200:
+                return False
+            deadline = loop.time() + self.MEDIA_FLOW_WINDOW
+            while loop.time() < deadline and not flow.full() and not rtsp.closed:
+                await asyncio.sleep(0.1)
+            flowing = flow.packets >= self.MEDIA_FLOW_MIN_PACKETS and flow.advancing()
+            if not rtsp.closed:
+                try:
+                    await asyncio.wait_for(rtsp.teardown(), self.TEARDOWN_TIMEOUT)
+                except (asyncio.TimeoutError, RTSPError):
+                    pass
+            return flowing
+
+    async def _rtsp_request(self, uri, method):
+        async with self.rtsp_client(uri) as rtsp:
+            self._connected(uri)
+            response = await getattr(rtsp, method)()
+            return response.status == 200
+
+    def _connected(self, uri):
+        '''Expires the stream uris the camera flagged InvalidAfterConnect'''
+        for profile in self.profiles:
+            if profile.rtsp_uri == uri and profile.InvalidAfterConnect:
+                profile.uri_expires = 0
 
     def log(self, info):
         socks_info = ''
@@ -83,47 +307,122 @@ class Camera():
     def log_error(self, info):
         self.log('ERROR_LOG ' + str(info))
 
-    def probe_information(self):        
-        self.camera = ONVIFCamera(self.ip, 
-                            self.onvif,
-                            self.username, 
-                            self.password,
-                            wsdl, 
-                            transport=self.socks_transport
-                            )
+    def onvif_session(self):
+        '''Returns the long-lived ONVIFCamera, building it on first use or
+           after it was invalidated'''
+        if self.camera is None:
+            self.camera = ONVIFCamera(self.ip, 
+                                self.onvif,
+                                self.username, 
+                                self.password,
+                                wsdl, 
+                                transport=self.socks_transport,
+                                no_events=True
+                                )
+        return self.camera
+
+    def invalidate_session(self):
+        '''Forces the next probe to rebuild the ONVIF session'''
+        self.camera = None
+
+    def invalidate_media(self, reboot=False):
+        '''Forces the next probe to refetch profiles and stream uris. After a
+           reboot only the uris the camera flagged InvalidAfterReboot are dropped'''
+        if not reboot:
+            self.profiles_expire = 0
+        for profile in self.profiles:
+            if not reboot or profile.InvalidAfterReboot:
+                profile.uri_expires = 0
+
+    def probe_information(self):
+        '''Refreshes what is due of the ONVIF information. Returns True when
+           the stream uri of the first profile was just fetched'''
+        try:
+            return self._probe_information(self.onvif_session())
+        except Exception:
+            # Auth and transport failures both surface here, rebuild next time.
+            # The camera may also have rebooted on its own.
+            self.invalidate_session()
+            self.invalidate_media(reboot=True)
+            raise
+
+    def _probe_information(self, camera):
+        self._check_clock(camera)
+        fresh = False
         #self.log('getting capabilities...')
-        resp = self.camera.devicemgmt.GetCapabilities()
+        resp = camera.devicemgmt.GetCapabilities()
         if resp["Imaging"]:
             #self.log('supports imaging services')
             self.imaging_url = resp["Imaging"]["XAddr"]
         if resp["Media"]:
             #self.log('supports media services')
             #self.log('querying media services...')
-            media_service = self.camera.create_media_service()
-            #self.log('querying profiles...')
-            profiles = media_service.GetProfiles()
-            for profile in profiles:
-                p = Profile()
-                p.name = profile.Name
-                p.token = profile.token
-                p.encoding = profile.VideoEncoderConfiguration.Encoding
-                p.resolution_W = profile.VideoEncoderConfiguration.Resolution.Width
-                p.resolution_H = profile.VideoEncoderConfiguration.Resolution.Height
-                p.quality = profile.VideoEncoderConfiguration.Quality
-                p.framerate_limit = profile.VideoEncoderConfiguration.RateControl.FrameRateLimit
-                p.encoding_interval = profile.VideoEncoderConfiguration.RateControl.EncodingInterval
-                p.bitrate_limit = profile.VideoEncoderConfiguration.RateControl.BitrateLimit
-                self.profiles.append(p)
-
-            for profile in self.profiles:
-                #self.log('getting system uri for profile ' + profile.name + " ...")
-                params = self.camera.devicemgmt.create_type('GetSystemUris')
-                resp = self.camera.media.GetStreamUri({'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}}, 'ProfileToken': profile.token})
-                if resp['Uri']:
-                    profile.rtsp_uri = resp['Uri']
-                    profile.InvalidAfterConnect = resp['InvalidAfterConnect']
-                    profile.InvalidAfterReboot = resp['InvalidAfterReboot']
-                    profile.Timeout = resp['Timeout']
+            media_service = camera.get_service('media')
+            now = time.monotonic()
+            if not self.profiles or now >= self.profiles_expire:
+                #self.log('querying profiles...')
+                self.profiles = self._get_profiles(media_service)
+                self.profiles_expire = now + self.MEDIA_CACHE_TTL
+
+            for i, profile in enumerate(self.profiles):
+                if profile.rtsp_uri is None or now >= profile.uri_expires:
+                    self._get_stream_uri(media_service, profile, now)
+                    fresh = fresh or i == 0
+        return fresh
+
+    def _check_clock(self, camera):
+        '''Detects reboots the camera did on its own: its clock restarts from
+           a default, or jumps when NTP sets it again, so the offset to our
+           clock changes. A mere NTP correction costs a GetStreamUri'''
+        resp = camera.devicemgmt.GetSystemDateAndTime()
+        camera_time = onvif_datetime(resp.UTCDateTime)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        if camera_time is None:
+            camera_time = onvif_datetime(resp.LocalDateTime)
+            now = datetime.datetime.now()
+        if camera_time is None:
+            return
+        offset = (camera_time - now).total_seconds()
+        if self.clock_offset is not None and \
+                abs(offset - self.clock_offset) > self.REBOOT_CLOCK_JUMP:
+            self.log('camera clock jumped %+d s, assuming it rebooted' % (offset - self.clock_offset))
+            self.invalidate_media(reboot=True)
+        self.clock_offset = offset
+
+    def _get_profiles(self, media_service):
+        profiles = []
+        for profile in media_service.GetProfiles():
+            vec = profile.VideoEncoderConfiguration
+            profiles.append(Profile(name=profile.Name,
+                                    token=profile.token,
+                                    encoding=vec.Encoding,
+                                    resolution_W=vec.Resolution.Width,
+                                    resolution_H=vec.Resolution.Height,
+                                    quality=vec.Quality,
+                                    framerate_limit=vec.RateControl.FrameRateLimit,
+                                    encoding_interval=vec.RateControl.EncodingInterval,
+                                    bitrate_limit=vec.RateControl.BitrateLimit))
+        return tuple(profiles)
+
+    def _get_stream_uri(self, media_service, profile, now):
+        #self.log('getting system uri for profile ' + profile.name + " ...")
+        resp = media_service.GetStreamUri({'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}}, 'ProfileToken': profile.token})
+        if resp['Uri']:
+            profile.rtsp_uri = resp['Uri']
+            profile.InvalidAfterConnect = resp['InvalidAfterConnect']
+            profile.InvalidAfterReboot = resp['InvalidAfterReboot']
+            profile.Timeout = resp['Timeout']
+            timeout = duration_seconds(profile.Timeout)
+            # PT0S means valid until the profile changes, i.e. until profiles are refetched
+            profile.uri_expires = now + timeout if timeout > 0 else float('inf')
+
+    def reboot(self):
+        try:
+            self.onvif_session().devicemgmt.SystemReboot()
+        finally:
+            # Services and subscriptions don't survive the reboot
+            self.invalidate_session()
+            self.invalidate_media(reboot=True)
 
     def choose_transport(self, rtsp_body):
         #self.log('rtsp body: ')
@@ -153,19 +452,11 @@ class Camera():
     def rtsp_uri_ensure_username(self, uri):
         if '@' not in uri: #Simple test. Does it cover all cases?
             return uri.replace('rtsp://', 'rtsp://' + self.username + ":" + self.password + '@')
+        return uri
 
-    def rtsp_connect(self, uri):
-        #self.log('rtsp connection to uri ' + uri)
-        #RTSP_timeout = 10
-        uri = self.rtsp_uri_ensure_username(uri)
-        #uri = self.rtsp_uri#.replace('554\/11', '10554')
-        #self.log('opening RTSP connection to url ' + uri + ' ...')
-        callback = lambda x: self.log('\n' + x) 
-        sock = None
-        if self.socks:
-            sock = socks.socksocket() # Same API as socket.socket in the standard lib
-            #The true is for remote dns resolution
-            sock.set_proxy(socks.SOCKS5, self.socks_host, self.socks_port, True, self.socks_user, self.socks_password) # (socks.SOCKS5, "localhost", 1234)
-
-        myrtsp = RTSPClient(url=uri, callback=None, socks=None)#, timeout=RTSP_timeout)
-        return myrtsp
+    def rtsp_client(self, uri, interleaved_callback=None):
+        '''Unconnected AsyncRTSPClient, use it as "async with"'''
+        return AsyncRTSPClient(url=self.rtsp_uri_ensure_username(uri),
+                               interleaved_callback=interleaved_callback,
+                               connect_timeout=self.RTSP_TIMEOUT,
+                               timeout=self.RTSP_TIMEOUT)
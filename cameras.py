@@ -11,6 +11,7 @@ cams.append(Camera(id = None,
              #rtsp = '10554',
              username = 'admin',
              password = '19929394',
-             socks = None
+             socks = None,
+             #persistent_rtsp = True #Keep one RTSP connection open and alive instead of reconnecting per probe
              ))
 
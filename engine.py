@@ -0,0 +1,110 @@
+'''
+Single event loop scheduler that probes the whole camera fleet.
+Each camera gets a lightweight coroutine instead of its own rx pipeline,
+and at most `concurrency` probes are in flight at any time.
+'''
+import asyncio
+import datetime
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+def log(info):
+    print(str(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')) + ' ' + str(info))
+
+class WatchdogEngine(object):
+    LAG_CHECK_INTERVAL = 5 # Seconds
+    LAG_WARNING        = 1 # Seconds late before the loop is reported as stalled
+    DRAIN_TIMEOUT      = 30 # Seconds to wait for in-flight probes on shutdown
+
+    def __init__(self, cams, on_condition, interval=55, concurrency=64, loop=None):
+        self.cams = cams
+        self.on_condition = on_condition # coroutine (cam, condition)
+        self.interval = interval
+        self.concurrency = concurrency
+        self.loop = loop or asyncio.get_event_loop()
+        # Blocking ONVIF/RTSP work is bounded by the same limit as the probes
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.loop.set_default_executor(self.executor)
+        self.tasks = []
+        self.in_flight = set()
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stopping = False
+        self._semaphore = None
+
+    def start(self):
+        '''Schedules every camera, spreading the first probes over one interval'''
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        n = len(self.cams)
+        for i, cam in enumerate(self.cams):
+            delay = self.interval + self.interval * i / n
+            self.tasks.append(asyncio.ensure_future(self._run(cam, delay)))
+        self.tasks.append(asyncio.ensure_future(self.monitor_lag()))
+
+    async def stop(self):
+        '''Stops scheduling, waits up to DRAIN_TIMEOUT for in-flight probes,
+           then closes the persistent RTSP sessions'''
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        if self.in_flight:
+            log('waiting for %d in-flight probes' % len(self.in_flight))
+            done, pending = await asyncio.wait(self.in_flight, timeout=self.DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+        sessions = [cam.close_rtsp_session() for cam in self.cams]
+        await asyncio.gather(*[session.wait_closed() for session in sessions if session])
+        self.executor.shutdown(wait=False)
+
+    def run(self):
+        '''Blocks in the event loop until SIGINT/SIGTERM, then drains and returns'''
+        def shutdown(signame):
+            if self.stopping: # Second signal, don't wait for the drain
+                self.loop.stop()
+                return
+            log('received %s, shutting down' % signame)
+            asyncio.ensure_future(self.stop()).add_done_callback(lambda f: self.loop.stop())
+
+        for signame in ('SIGINT', 'SIGTERM'):
+            self.loop.add_signal_handler(getattr(signal, signame), shutdown, signame)
+        self.start()
+        try:
+            self.loop.run_forever()
+        finally:
+            for signame in ('SIGINT', 'SIGTERM'):
+                self.loop.remove_signal_handler(getattr(signal, signame))
+
+    async def monitor_lag(self):
+        '''Self-check: a sleep that wakes up late means the loop is stalled'''
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(self.LAG_CHECK_INTERVAL)
+            self.lag = self.loop.time() - start - self.LAG_CHECK_INTERVAL
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > self.LAG_WARNING:
+                log('ERROR_LOG scheduler lag %.3fs, %d probes in flight' %
+                    (self.lag, len(self.in_flight)))
+
+    async def _run(self, cam, delay):
+        next_run = self.loop.time() + delay
+        while True:
+            await asyncio.sleep(max(0, next_run - self.loop.time()))
+            # A probe that overran its slot is not run twice to catch up
+            next_run = max(next_run + self.interval, self.loop.time())
+            probe = asyncio.ensure_future(self.probe(cam))
+            self.in_flight.add(probe)
+            probe.add_done_callback(self.in_flight.discard)
+            # Cancelling the schedule on shutdown leaves the probe to be drained
+            await asyncio.shield(probe)
+
+    async def probe(self, cam):
+        async with self._semaphore:
+            if self.stopping: # Queued behind the limit when shutdown started
+                return
+            try:
+                condition = await cam.watchdog()
+                await self.on_condition(cam, condition)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                cam.log_error(e)
@@ -0,0 +1,50 @@
+'''
+Memory benchmark for the process-wide WSDL cache.
+
+Builds the devicemgmt and media services for N simulated cameras and
+reports resident memory per camera, with and without sharing the parsed
+WSDL documents. No camera is contacted, services are only bound.
+
+    python wsdl_memory.py [cameras]
+'''
+import os
+import sys
+import time
+
+from onvif import ONVIFService, clear_wsdl_cache
+
+WSDL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'wsdl')
+SERVICES = (
+    ('devicemgmt.wsdl', '{http://www.onvif.org/ver10/device/wsdl}DeviceBinding', '/onvif/device_service'),
+    ('media.wsdl', '{http://www.onvif.org/ver10/media/wsdl}MediaBinding', '/onvif/media_service'),
+)
+
+
+def rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def build(cameras, share_wsdl):
+    clear_wsdl_cache()
+    services = []
+    before = rss_kb()
+    start = time.time()
+    for i in range(cameras):
+        host = 'http://10.0.%d.%d:80' % (i // 250, i % 250 + 1)
+        for wsdl, binding, path in SERVICES:
+            services.append(ONVIFService(host + path, 'admin', 'admin',
+                                         os.path.join(WSDL_DIR, wsdl),
+                                         binding_name=binding,
+                                         share_wsdl=share_wsdl))
+    elapsed = time.time() - start
+    used = rss_kb() - before
+    print('share_wsdl=%-5s cameras=%d  %.2fs  RSS +%d KiB  (%.1f KiB/camera)' %
+          (share_wsdl, cameras, elapsed, used, used / float(cameras)))
+    return services
+
+
+if __name__ == '__main__':
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    build(cameras, share_wsdl=True)
+    build(cameras, share_wsdl=False)
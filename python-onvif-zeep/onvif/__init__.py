@@ -1,4 +1,5 @@
-from onvif.client import ONVIFService, ONVIFCamera, SERVICES
+from onvif.client import ONVIFService, ONVIFCamera, SERVICES, \
+        get_wsdl_document, clear_wsdl_cache
 from onvif.exceptions import ONVIFError, ERR_ONVIF_UNKNOWN, \
         ERR_ONVIF_PROTOCOL, ERR_ONVIF_WSDL, ERR_ONVIF_BUILD
 #from onvif import cli
@@ -6,5 +7,5 @@ from onvif.exceptions import ONVIFError, ERR_ONVIF_UNKNOWN, \
 __all__ = ( 'ONVIFService', 'ONVIFCamera', 'ONVIFError',
             'ERR_ONVIF_UNKNOWN', 'ERR_ONVIF_PROTOCOL',
             'ERR_ONVIF_WSDL', 'ERR_ONVIF_BUILD',
-            'SERVICES'#, 'cli'
+            'SERVICES', 'get_wsdl_document', 'clear_wsdl_cache'#, 'cli'
            )
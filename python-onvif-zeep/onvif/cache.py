@@ -0,0 +1,171 @@
+'''
+On-disk cache of parsed WSDL documents.
+
+Parsing the ONVIF WSDL/XSD tree dominates cold start, so the parsed zeep
+Document is pickled into a cache directory next to the wsdl directory,
+keyed by a hash of every file in that directory and the parser settings.
+Pre-warm it at image build time with:
+
+    onvif-wsdl-cache [wsdl_dir]    (or: python -m onvif.cache [wsdl_dir])
+'''
+from __future__ import print_function
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from threading import RLock
+
+import zeep
+from lxml import etree
+from zeep.settings import Settings
+from zeep.transports import Transport
+
+from onvif.definition import SERVICES
+
+logger = logging.getLogger('onvif')
+
+# None means a 'wsdl_cache' directory next to the wsdl directory
+WSDL_CACHE_DIR = None
+
+_dir_hashes = {}
+_dir_hashes_lock = RLock()
+
+
+def _rebuild_class(name, bases, attrs):
+    return type(name, bases, attrs)
+
+
+class _DocumentPickler(pickle.Pickler):
+    '''Pickles what zeep builds at parse time and plain pickle can't:
+       dynamically created xsd classes, lxml QNames and dict views'''
+
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and obj.__module__ in ('zeep.xsd.dynamic_types', 'zeep.objects'):
+            attrs = dict((k, v) for k, v in vars(obj).items()
+                         if k not in ('__dict__', '__weakref__'))
+            return _rebuild_class, (obj.__name__, obj.__bases__, attrs)
+        if isinstance(obj, etree.QName):
+            return etree.QName, (obj.text,)
+        if type(obj).__name__ in ('odict_values', 'odict_keys', 'dict_values', 'dict_keys'):
+            return list, (list(obj),)
+        return NotImplemented
+
+    def persistent_id(self, obj):
+        # Runtime objects are supplied again by the loader
+        if isinstance(obj, Transport):
+            return 'transport'
+        if isinstance(obj, Settings):
+            return 'settings'
+        return None
+
+
+class _DocumentUnpickler(pickle.Unpickler):
+    def __init__(self, f, settings):
+        pickle.Unpickler.__init__(self, f)
+        self.settings = settings
+
+    def persistent_load(self, pid):
+        if pid == 'transport':
+            return Transport()
+        if pid == 'settings':
+            return self.settings
+        raise pickle.UnpicklingError('Unknown persistent id %r' % pid)
+
+
+def supported():
+    # Pickler.reducer_override is needed to pickle zeep's dynamic types
+    return sys.version_info >= (3, 8)
+
+
+def cache_dir(wsdl_dir):
+    return WSDL_CACHE_DIR or os.path.join(os.path.dirname(os.path.abspath(wsdl_dir)), 'wsdl_cache')
+
+
+def wsdl_dir_hash(wsdl_dir):
+    '''Hash of the content of every file under wsdl_dir, since a WSDL
+       pulls in its imports from the same tree'''
+    wsdl_dir = os.path.realpath(wsdl_dir)
+    with _dir_hashes_lock:
+        digest = _dir_hashes.get(wsdl_dir)
+        if digest is None:
+            sha = hashlib.sha256()
+            for root, dirs, files in os.walk(wsdl_dir):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    sha.update(os.path.relpath(path, wsdl_dir).encode())
+                    with open(path, 'rb') as f:
+                        sha.update(f.read())
+            digest = _dir_hashes[wsdl_dir] = sha.hexdigest()
+        return digest
+
+
+def cache_path(url, settings, no_cache=False):
+    wsdl_dir = os.path.dirname(os.path.realpath(url))
+    key = '%s|%s|%s|%s|%s|%s' % (wsdl_dir_hash(wsdl_dir), os.path.basename(url),
+                                 no_cache, settings.strict, settings.xml_huge_tree,
+                                 zeep.__version__)
+    name = '%s-%s.pickle' % (os.path.splitext(os.path.basename(url))[0],
+                             hashlib.sha256(key.encode()).hexdigest()[:16])
+    return os.path.join(cache_dir(wsdl_dir), name)
+
+
+def load(url, settings, no_cache=False):
+    '''Returns the cached Document for url, or None on any miss'''
+    if not supported():
+        return None
+    try:
+        with open(cache_path(url, settings, no_cache), 'rb') as f:
+            return _DocumentUnpickler(f, settings).load()
+    except (IOError, OSError):
+        return None
+    except Exception:
+        logger.exception('Ignoring unreadable WSDL cache for %s', url)
+        return None
+
+
+def store(url, settings, document, no_cache=False):
+    '''Writes document to the cache, silently skipped on read-only trees'''
+    if not supported():
+        return
+    path = cache_path(url, settings, no_cache)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    limit = sys.getrecursionlimit()
+    try:
+        # The schema graph is deep
+        sys.setrecursionlimit(max(limit, 20000))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(tmp, 'wb') as f:
+            _DocumentPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(document)
+        os.replace(tmp, path)
+    except Exception:
+        logger.warning('Could not write WSDL cache %s', path, exc_info=True)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def warm(wsdl_dir):
+    '''Parses and caches every service WSDL under wsdl_dir'''
+    from onvif.client import get_wsdl_document, default_settings
+    for wsdl_file in sorted(set(s['wsdl'] for s in SERVICES.values())):
+        url = os.path.join(wsdl_dir, wsdl_file)
+        if os.path.isfile(url):
+            get_wsdl_document(url, default_settings())
+            print(cache_path(url, default_settings()))
+
+
+def main():
+    wsdl_dir = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'wsdl')
+    if not supported():
+        print('WSDL cache needs Python >= 3.8')
+        return 1
+    warm(wsdl_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
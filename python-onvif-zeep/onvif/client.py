@@ -28,6 +28,44 @@ def safe_func(func):
     return wrapped
 
 
+# Parsed WSDL documents shared by every ONVIFService in the process.
+# Only the binding address, transport and wsse credentials are per camera.
+_wsdl_documents = {}
+_wsdl_documents_lock = RLock()
+
+
+def default_settings():
+    settings = Settings()
+    settings.strict = False
+    settings.xml_huge_tree = True
+    return settings
+
+
+def get_wsdl_document(url, settings, no_cache=False):
+    """
+    Return the parsed zeep Document for `url`, parsing it only once per
+    process for a given set of parser settings. Parsed documents are also
+    kept in the on-disk cache (see onvif.cache) for the next start.
+    """
+    from onvif import cache as wsdl_cache
+    key = (os.path.realpath(url), no_cache, settings.strict, settings.xml_huge_tree)
+    with _wsdl_documents_lock:
+        document = _wsdl_documents.get(key)
+        if document is None:
+            document = wsdl_cache.load(url, settings, no_cache)
+        if document is None:
+            ClientType = Client if no_cache else CachingClient
+            document = ClientType(wsdl=url, settings=settings).wsdl
+            wsdl_cache.store(url, settings, document, no_cache)
+        _wsdl_documents[key] = document
+        return document
+
+
+def clear_wsdl_cache():
+    with _wsdl_documents_lock:
+        _wsdl_documents.clear()
+
+
 class UsernameDigestTokenDtDiff(UsernameToken):
     """
     UsernameDigestToken class, with a time offset parameter that can be adjusted;
@@ -84,7 +122,7 @@ class ONVIFService(object):
     @safe_func
     def __init__(self, xaddr, user, passwd, url,
                  encrypt=True, daemon=False, zeep_client=None, no_cache=False,
-                 dt_diff=None, binding_name='', transport=None):
+                 dt_diff=None, binding_name='', transport=None, share_wsdl=True):
         if not os.path.isfile(url):
             raise ONVIFError('%s doesn`t exist!' % url)
 
@@ -94,10 +132,9 @@ class ONVIFService(object):
         # Create soap client
         if not zeep_client:
             ClientType = Client if no_cache else CachingClient
-            settings = Settings()
-            settings.strict = False
-            settings.xml_huge_tree = True
-            self.zeep_client = ClientType(wsdl=url, wsse=wsse, transport=transport, settings=settings)
+            settings = default_settings()
+            wsdl = get_wsdl_document(url, settings, no_cache) if share_wsdl else url
+            self.zeep_client = ClientType(wsdl=wsdl, wsse=wsse, transport=transport, settings=settings)
         else:
             self.zeep_client = zeep_client
         self.ws_client = self.zeep_client.create_service(binding_name, self.xaddr)
@@ -188,12 +225,14 @@ class ONVIFCamera(object):
                          'imaging': None, 'events': None, 'analytics': None}
     use_services_template = {'devicemgmt': True, 'ptz': True, 'media': True,
                              'imaging': True, 'events': True, 'analytics': True}
+    # Services unavailable with no_events=True
+    event_services = ('events', 'pullpoint', 'notification', 'subscription')
 
     def __init__(self, host, port, user, passwd,
                  wsdl_dir=os.path.join(os.path.dirname(os.path.dirname(__file__)),
                                        "wsdl"),
                  encrypt=True, daemon=False, no_cache=False, adjust_time=False,
-                 transport=None):
+                 transport=None, no_events=False):
         os.environ.pop('http_proxy', None)
         os.environ.pop('https_proxy', None)
         self.host = host
@@ -206,6 +245,8 @@ class ONVIFCamera(object):
         self.no_cache = no_cache
         self.adjust_time = adjust_time
         self.transport = transport
+        # Health-check-only users never touch the event services
+        self.no_events = no_events
 
         # Active service client container
         self.services = {}
@@ -216,6 +257,14 @@ class ONVIFCamera(object):
 
         self.to_dict = ONVIFService.to_dict
 
+    def __getattr__(self, name):
+        """
+        Services are created on first use, e.g. `mycam.media.GetProfiles()`
+        """
+        if name in SERVICES and name != 'devicemgmt':
+            return getattr(self, 'create_%s_service' % name)()
+        raise AttributeError(name)
+
     def update_xaddrs(self):
         # Establish devicemgmt service first
         self.dt_diff = None
@@ -239,13 +288,18 @@ class ONVIFCamera(object):
             except Exception:
                 logger.exception('Unexpected service type')
 
+    def update_pullpoint_xaddr(self):
+        """
+        Create the PullPoint subscription the first time it is needed.
+        Every call on a camera takes one of its (few) subscription slots.
+        """
+        ns = SERVICES['pullpoint']['ns'] + '/PullPointSubscription'
         with self.services_lock:
-            try:
-                self.event = self.create_events_service()
-                self.xaddrs['http://www.onvif.org/ver10/events/wsdl/PullPointSubscription'] = \
-                    self.event.CreatePullPointSubscription().SubscriptionReference.Address._value_1
-            except Exception:
-                pass
+            if ns not in self.xaddrs:
+                event = self.get_service('events')
+                self.xaddrs[ns] = \
+                    event.CreatePullPointSubscription().SubscriptionReference.Address._value_1
+        return self.xaddrs[ns]
 
     def update_url(self, host=None, port=None):
         changed = False
@@ -268,7 +322,7 @@ class ONVIFCamera(object):
                 self.services[sname].ws_client.set_options(location=xaddr)
 
     def get_service(self, name, create=True):
-        service = getattr(self, name.lower(), None)
+        service = self.services.get(name.lower())
         if not service and create:
             return getattr(self, 'create_%s_service' % name.lower())()
         return service
@@ -317,6 +371,8 @@ class ONVIFCamera(object):
         """Create ONVIF service client"""
 
         name = name.lower()
+        if name in self.event_services and self.no_events:
+            raise ONVIFError('Events are disabled for this camera')
         xaddr, wsdl_file, binding_name = self.get_definition(name, portType)
 
         with self.services_lock:
@@ -370,6 +426,7 @@ class ONVIFCamera(object):
         return self.create_onvif_service('replay', transport=transport)
 
     def create_pullpoint_service(self, transport=None):
+        self.update_pullpoint_xaddr()
         return self.create_onvif_service('pullpoint',
                                          portType='PullPointSubscription',
                                          transport=transport)
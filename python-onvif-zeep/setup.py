@@ -51,6 +51,7 @@ setup(
       include_package_data=True,
       data_files=[(wsdl_dst_dir, wsdl_files)],
       entry_points={
-          'console_scripts': ['onvif-cli = onvif.cli:main']
+          'console_scripts': ['onvif-cli = onvif.cli:main',
+                              'onvif-wsdl-cache = onvif.cache:main']
           }
      )
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------
+# Benchmark: threads and RSS for N concurrent RTSP sessions, one receive
+# thread per RTSPClient vs all clients multiplexed on an RTSPEngine vs
+# AsyncRTSPClient on an asyncio loop
+#
+#   python bench_engine.py [sessions]
+#-----------------------------------------------------------------------
+import sys, os, asyncio, socket, selectors, resource, threading, time, multiprocessing
+sys.path.append('../')
+from rtsp import AsyncRTSPClient, RTSPClient, RTSPEngine
+
+def serve(listener):
+    '''Minimal RTSP server answering every request with 200 OK'''
+    sel = selectors.DefaultSelector()
+    sel.register(listener, selectors.EVENT_READ)
+    bufs = {}
+    while True:
+        for key, mask in sel.select():
+            if key.fileobj is listener:
+                conn, addr = listener.accept()
+                sel.register(conn, selectors.EVENT_READ)
+                bufs[conn] = b''
+                continue
+            conn = key.fileobj
+            data = conn.recv(4096)
+            if not data:
+                sel.unregister(conn)
+                conn.close()
+                del bufs[conn]
+                continue
+            bufs[conn] += data
+            while b'\r\n\r\n' in bufs[conn]:
+                msg, bufs[conn] = bufs[conn].split(b'\r\n\r\n', 1)
+                cseq = [l for l in msg.split(b'\r\n') if l.lower().startswith(b'cseq')][0]
+                conn.sendall(b'RTSP/1.0 200 OK\r\n' + cseq + b'\r\nPublic: OPTIONS\r\n\r\n')
+
+def rss_kib():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1])
+
+def run(url, sessions, use_engine):
+    base_threads, base_rss = threading.active_count(), rss_kib()
+    engine = RTSPEngine() if use_engine else None
+    start = time.time()
+    clients = [RTSPClient(url, callback=lambda msg: None, engine=engine) for i in range(sessions)]
+    futures = [c.do_options() for c in clients]
+    ok = sum(1 for f in futures if f.result(timeout=30).status == 200)
+    elapsed = time.time() - start
+    threads, rss = threading.active_count() - base_threads, rss_kib() - base_rss
+    for c in clients:
+        c.close()
+    if engine:
+        engine.stop()
+    return ok, elapsed, threads, rss
+
+def run_async(url, sessions):
+    loop = asyncio.get_event_loop()
+    base_threads, base_rss = threading.active_count(), rss_kib()
+    async def options(client):
+        await client.connect()
+        return (await client.options()).status == 200
+    start = time.time()
+    clients = [AsyncRTSPClient(url) for i in range(sessions)]
+    ok = sum(loop.run_until_complete(asyncio.gather(*[options(c) for c in clients])))
+    elapsed = time.time() - start
+    threads, rss = threading.active_count() - base_threads, rss_kib() - base_rss
+    for c in clients:
+        c.close()
+    loop.run_until_complete(asyncio.sleep(0))
+    return ok, elapsed, threads, rss
+
+if __name__ == '__main__':
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = 2 * sessions + 256
+    if soft < want:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(want, hard), hard))
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    url = 'rtsp://127.0.0.1:%d/bench' % listener.getsockname()[1]
+    server = multiprocessing.Process(target=serve, args=(listener,), daemon=True)
+    server.start()
+
+    for name, bench in (('asyncio', lambda: run_async(url, sessions)),
+                        ('engine', lambda: run(url, sessions, True)),
+                        ('threads', lambda: run(url, sessions, False))):
+        ok, elapsed, threads, rss = bench()
+        print('%-8s %d/%d OPTIONS ok in %.2fs, +%d threads, +%.1f MiB RSS'
+              % (name, ok, sessions, elapsed, threads, rss / 1024.0))
+        time.sleep(1) # let closed sockets and threads wind down
+    server.terminate()
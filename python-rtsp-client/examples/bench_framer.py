@@ -0,0 +1,109 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------
+# Micro-benchmark: RTSP responses framed per second from a byte stream
+# delivered in 2 KB chunks, list+join buffer (old recv_msg) vs RTSPFramer.
+# Then interleaved RTP packets demuxed per second from RECV_BUFFER_SIZE chunks,
+# copy-and-delete per frame vs RTSPFramer memoryview delivery
+#
+#   python bench_framer.py [messages] [sdp_bytes] [rtp_packets]
+#-----------------------------------------------------------------------
+import struct, sys, time
+sys.path.append('../')
+from rtsp import RTSPFramer, HEADER_END_STR, RECV_BUFFER_SIZE
+import re
+
+def make_stream(count, sdp_size):
+    sdp = ('a=x-padding:' + 'x'*70 + '\r\n') * (sdp_size // 84 + 1)
+    msgs = []
+    for i in range(count):
+        msgs.append('RTSP/1.0 200 OK\r\nCSeq: %d\r\nContent-Type: application/sdp\r\n'
+                    'Content-Length: %d\r\n\r\n%s' % (i, len(sdp), sdp))
+    data = ''.join(msgs).encode()
+    return [data[i:i+2048] for i in range(0, len(data), 2048)]
+
+def legacy(chunks):
+    '''The list+join buffer recv_msg used before RTSPFramer'''
+    response_buf = []
+    cache = lambda: ''.join(response_buf)
+    count = 0
+    chunks = iter(chunks)
+    while True:
+        while HEADER_END_STR not in cache():
+            more = next(chunks, None)
+            if more is None:
+                return count
+            response_buf.append(more.decode())
+        (msg, tmp) = cache().split(HEADER_END_STR, 1)
+        m = re.search(r'content-length:\s?(?P<len>\d+)', msg.lower(), re.S)
+        content_length = (m and int(m.group('len'))) or 0
+        while len(tmp) < content_length:
+            more = next(chunks, None)
+            if more is None:
+                return count
+            response_buf.append(more.decode())
+            (msg, tmp) = cache().split(HEADER_END_STR, 1)
+        del response_buf[:]
+        response_buf.append(tmp[content_length:])
+        count += 1
+
+def framer(chunks):
+    f = RTSPFramer()
+    count = 0
+    for chunk in chunks:
+        f.feed(chunk)
+        while f.next_msg() is not None:
+            count += 1
+    return count
+
+def make_rtp_stream(count, size=1400):
+    payload = b'\x00' * size
+    data = b''.join(b'$\x00' + struct.pack('!H', size) + payload for i in range(count))
+    return [data[i:i+RECV_BUFFER_SIZE] for i in range(0, len(data), RECV_BUFFER_SIZE)]
+
+def legacy_interleaved(chunks):
+    '''bytes() copy of every frame and del of the buffer head per frame'''
+    counter = [0]
+    def on_packet(channel, data):
+        counter[0] += 1
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= 4 and buf[0] == 0x24:
+            length = 4 + ((buf[2] << 8) | buf[3])
+            if len(buf) < length:
+                break
+            channel = buf[1]
+            with memoryview(buf) as view:
+                data = bytes(view[4:length])
+            del buf[:length]
+            on_packet(channel, data)
+    return counter[0]
+
+def framer_interleaved(chunks):
+    counter = [0]
+    def on_packet(channel, data):
+        counter[0] += 1
+    f = RTSPFramer()
+    f.set_channel_callback(0, on_packet)
+    for chunk in chunks:
+        f.feed(chunk)
+        f.next_msg()
+    return counter[0]
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sdp_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16384
+    chunks = make_stream(count, sdp_size)
+    for name, func in (('list+join', legacy), ('RTSPFramer', framer)):
+        start = time.time()
+        framed = func(chunks)
+        elapsed = time.time() - start
+        print('%-10s %6d messages  %8.0f msg/s' % (name, framed, framed / elapsed))
+
+    packets = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+    chunks = make_rtp_stream(packets)
+    for name, func in (('copy+del', legacy_interleaved), ('memoryview', framer_interleaved)):
+        start = time.time()
+        demuxed = func(chunks)
+        elapsed = time.time() - start
+        print('%-10s %6d packets   %8.0f pkt/s' % (name, demuxed, demuxed / elapsed))
@@ -0,0 +1,185 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------
+# Benchmark: RTP packets depacketized into frames per second, the
+# bitstring parser that RTPReceive.digestpacket used (prints included,
+# sent to /dev/null), the struct parser with frames grown by +=, and
+# H264Depacketizer assembling access units in pooled buffers, and that
+# behind a ReorderBuffer fed with packets out of order
+#
+#   python bench_rtp.py [corpus]            corpus recorded below, or a
+#                                           synthetic H.264 stream
+#   python bench_rtp.py record url corpus [seconds]
+#
+# A corpus holds RTP packets framed like RTP over RTSP/TCP:
+# '$', channel, 16 bit length, packet
+#-----------------------------------------------------------------------
+import asyncio, contextlib, os, random, struct, sys, time
+sys.path.append('../')
+from rtsp import AsyncRTSPClient
+from rtp import H264Depacketizer, ReorderBuffer, START_CODE, parse_rtp
+
+def synthetic_corpus(frames=300, frame_size=20000, idr_size=150000, gop=25, mtu=1400):
+    '''SPS, PPS and one FU-A fragmented NAL unit per frame, an IDR frame
+       every gop frames'''
+    packets = []
+    seq = 0
+    def packet(payload, timestamp, marker=False):
+        nonlocal seq
+        seq = (seq + 1) & 0xffff
+        return struct.pack('!BBHII', 0x80, 96 | (0x80 if marker else 0), seq, timestamp,
+                           0x1234) + payload
+    for i in range(frames):
+        ts = i * 3600
+        packets.append(packet(b'\x67' + b'\x42' * 10, ts))
+        packets.append(packet(b'\x68' + b'\xce' * 4, ts))
+        if i % gop == 0:
+            nal = b'\x65' + os.urandom(idr_size)
+        else:
+            nal = b'\x41' + os.urandom(frame_size)
+        body = nal[1:]
+        chunks = [body[j:j+mtu] for j in range(0, len(body), mtu)]
+        for j, chunk in enumerate(chunks):
+            fu_header = (nal[0] & 0x1f) | (0x80 if j == 0 else 0) | (0x40 if j == len(chunks)-1 else 0)
+            packets.append(packet(bytes((0x7c, fu_header)) + chunk, ts,
+                                  marker=j == len(chunks)-1))
+    return packets
+
+def load_corpus(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    packets, pos = [], 0
+    while pos + 4 <= len(data):
+        length = struct.unpack_from('!H', data, pos + 2)[0]
+        packets.append(data[pos+4:pos+4+length])
+        pos += 4 + length
+    return packets
+
+def record(url, path, seconds):
+    '''Saves the RTP of the first track, received interleaved over RTSP'''
+    async def run():
+        with open(path, 'wb') as f:
+            def on_packet(channel, data):
+                f.write(b'$' + bytes((channel,)) + struct.pack('!H', len(data)) + data)
+            async with AsyncRTSPClient(url) as rtsp:
+                rtsp.set_channel_callback(0, on_packet)
+                await rtsp.describe()
+                rtsp.TRANSPORT_TYPE_LIST = ['rtp_avp_tcp']
+                await rtsp.setup(0)
+                await rtsp.play()
+                await asyncio.sleep(seconds)
+    asyncio.get_event_loop().run_until_complete(run())
+
+def legacy(packets):
+    '''Header and NAL parsing as digestpacket did before, with bitstring'''
+    import bitstring
+    # BitArray(bytes=...) was removed in recent bitstring releases
+    to_bits = getattr(bitstring.BitArray, 'from_bytes', None) or \
+              (lambda st: bitstring.BitArray(bytes=st))
+    frame_done = True
+    frame = b''
+    out = 0
+    for st in packets:
+        bt = to_bits(st)
+        lc, bc = 12, 12*8
+        version, p, x, cc = bt[0:2].uint, bt[3], bt[4], bt[4:8].uint
+        m, pt, sn = bt[9], bt[9:16].uint, bt[16:32].uint
+        timestamp, ssrc = bt[32:64].uint, bt[64:96].uint
+        print("*----* Packet Begin *----* (Len: {})".format(len(st)))
+        print("Ver: {}, P: {}, X: {}, CC: {}, M: {}, PT: {}".format(version,p,x,cc,m,pt))
+        print("Sequence number: {}, Timestamp: {}".format(sn,timestamp))
+        print("Sync. Source Identifier: {}".format(ssrc))
+        fb, nri, nlu0, typ = bt[bc], bt[bc+1:bc+3].uint, bt[bc:bc+3], bt[bc+3:bc+8].uint
+        print("   *-* NAL Header *-*")
+        print("F: {}, NRI: {}, Type: {}".format(fb, nri, typ))
+        print("First three bits together : {}".format(bt[bc:bc+3]))
+        if typ == 7 or typ == 8:
+            out += len(frame + b"\x00\x00\x00\x01" + st[lc:])
+            frame = b''
+            continue
+        bc += 8; lc += 1
+        start, end, nlu1 = bt[bc], bt[bc+2], bt[bc+3:bc+8]
+        head = b""
+        if frame_done and start:
+            frame_done = False
+            head = b"\x00\x00\x00\x01" + (nlu0+nlu1).bytes
+            lc += 1
+        elif not frame_done and not start and not end:
+            lc += 1
+        elif not frame_done and end:
+            frame_done = True
+            lc += 1
+        if typ == 28:
+            frame += head + st[lc:]
+        if frame and frame_done:
+            out += len(frame)
+            frame = b''
+    return out
+
+def concat(packets):
+    '''struct parsing, frames grown with self.frame += as RTPReceive.run did'''
+    frame_done = True
+    frame = b''
+    out = 0
+    for st in packets:
+        header, payload = parse_rtp(st)
+        nal_header = payload[0]
+        framelet = None
+        if nal_header & 0x1f in (7, 8):
+            framelet = START_CODE + payload
+        elif nal_header & 0x1f == 28:
+            fu_header = payload[1]
+            head = b""
+            if frame_done and fu_header & 0x80:
+                frame_done = False
+                head = START_CODE + bytes(((nal_header & 0xe0) | (fu_header & 0x1f),))
+            elif not frame_done and fu_header & 0x40:
+                frame_done = True
+            framelet = head + payload[2:]
+        if framelet:
+            frame += framelet
+        if frame and frame_done:
+            out += len(frame)
+            frame = b''
+    return out
+
+def pooled(packets):
+    out = [0]
+    def on_frame(frame):
+        out[0] += len(frame)
+    d = H264Depacketizer(on_frame)
+    for st in packets:
+        d.process_packet(st)
+    return out[0]
+
+def reordered(packets):
+    '''pooled behind a ReorderBuffer, with neighbouring packets swapped'''
+    packets = list(packets)
+    rand = random.Random(0)
+    for i in range(0, len(packets) - 1, 10):
+        j = i + rand.randrange(1, 4)
+        if j < len(packets):
+            packets[i], packets[j] = packets[j], packets[i]
+    out = [0]
+    def on_frame(frame):
+        out[0] += len(frame)
+    d = H264Depacketizer(on_frame)
+    reorder = ReorderBuffer(d.process)
+    for st in packets:
+        reorder.push(*parse_rtp(st))
+    reorder.flush()
+    d.flush()
+    return out[0]
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'record':
+        record(sys.argv[2], sys.argv[3], float(sys.argv[4]) if len(sys.argv) > 4 else 10)
+        sys.exit(0)
+    packets = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else synthetic_corpus()
+    for name, func in (('bitstring', legacy), ('concat', concat), ('pooled', pooled),
+                       ('reordered', reordered)):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.time()
+            size = func(packets)
+            elapsed = time.time() - start
+        print('%-10s %6d packets  %8.0f pkt/s  %6.1f MB out'
+              % (name, len(packets), len(packets) / elapsed, size / 1e6))
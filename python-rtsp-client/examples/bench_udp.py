@@ -0,0 +1,72 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------
+# Benchmark: RTP over UDP received by RTPReceive, one recv() per packet
+# as before vs batched recvmsg_into() into preallocated buffers, with
+# the default and a large socket receive buffer. A sender process plays
+# the synthetic stream of bench_rtp.py, each frame sent in one burst
+#
+#   python bench_udp.py [frames] [frame interval s]
+#-----------------------------------------------------------------------
+import sys, os, resource, socket, time, multiprocessing
+sys.path.append('../')
+from rtp import RTPReceive
+from bench_rtp import synthetic_corpus
+
+class PerPacketReceive(RTPReceive):
+    '''RTPReceive receiving as it did, a blocking recv() per packet'''
+    def run(self):
+        self._sock.settimeout(self.timeout)
+        self.kernel_drops = None # recv() doesn't tell
+        self.running = True
+        try:
+            while self.running:
+                self.process_packet(self._sock.recv(2048))
+        except OSError:
+            pass
+        finally:
+            self._sock.close()
+
+def send(port, packets, interval):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    frame = []
+    for st in packets:
+        frame.append(st)
+        if st[1] & 0x80: # marker, the frame is complete
+            for packet in frame:
+                sock.sendto(packet, ('127.0.0.1', port))
+            frame = []
+            time.sleep(interval)
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def run(cls, packets, interval, rcvbuf):
+    frames = [0]
+    def on_frame(frame):
+        frames[0] += 1
+    rtp = cls([0], callback=on_frame, timeout=1, rcvbuf=rcvbuf)
+    port = rtp._sock.getsockname()[1]
+    start = cpu_time()
+    sender = multiprocessing.Process(target=send, args=(port, packets, interval))
+    sender.start()
+    sender.join()
+    time.sleep(0.5) # let the receiver drain
+    cpu = cpu_time() - start
+    received = rtp.reorder.received
+    rtp.close()
+    rtp.join()
+    return received, frames[0], cpu, rtp.rcvbuf, rtp.kernel_drops
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 0.04
+    packets = synthetic_corpus(frames=frames, idr_size=400000, frame_size=40000)
+    for name, cls, rcvbuf in (('recv', PerPacketReceive, 0),
+                              ('batched', RTPReceive, 0),
+                              ('batched', RTPReceive, 4 << 20)):
+        received, done, cpu, size, drops = run(cls, packets, interval, rcvbuf)
+        print('%-8s rcvbuf %7d: %5d/%d packets, %3d/%d frames, %4.1f us cpu/packet, '
+              'kernel drops %s' % (name, size, received, len(packets), done, frames,
+                                   1e6 * cpu / max(received, 1), drops))
+        time.sleep(0.5)
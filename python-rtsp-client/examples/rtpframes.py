@@ -95,7 +95,7 @@ def main(url, options):
         return
 
     try:
-        myrtsp.do_describe()
+        describe = myrtsp.do_describe()
         while myrtsp.state != 'describe':
             time.sleep(0.1)
         myrtsp.do_setup(0)
@@ -103,7 +103,7 @@ def main(url, options):
             time.sleep(0.1)
         #Setup up RTP capture here
         f=open('test.h264','wb')
-        rtpframes = RTPReceive([10014],callback=f.write)
+        rtpframes = RTPReceive([10014],callback=f.write,sdp=describe.result().body)
         while not rtpframes.running:
             time.sleep(0.1)
         myrtsp.do_play(myrtsp.cur_range, myrtsp.cur_scale)
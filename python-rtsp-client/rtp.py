@@ -5,116 +5,327 @@ https://stackoverflow.com/questions/28022432/receiving-rtp-packets-after-rtsp-se
 Written 2017 Mike Killian
 '''
 
-import re, socket, threading
-import bitstring # if you don't have this from your linux distro, install with "pip install bitstring"
+import abc, logging, re, selectors, socket, struct, sys, threading, time
+from collections import deque, namedtuple
 
-class RTPReceive(threading.Thread):
-    '''
-    This will open a socket on the client ports sent in RTSP setup request and
-    return data as its received to the callback function. 
-    '''
-    def __init__(self, client_ports, callback=None):
-        threading.Thread.__init__(self)
-        self._callback = callback or (lambda x: None)
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._sock.bind(("", client_ports[0])) # we open a port that is visible to the whole internet (the empty string "" takes care of that)
-        self._sock.settimeout(5) # if the socket is dead for 5 s., its thrown into trash
-        self.closed     = False
-        self.frame      = b''
-        self.frame_done = True #Did we get the last packet to fill a whole frame?
-        self.running    = False
-        self.sprop-parameter-sets = 'Z0IAIJWoFAHmQA==,aM48gA=='
-        self.start()
+log = logging.getLogger(__name__)
 
-    def run(self):
-        self.running = True
+RTP_HEADER    = struct.Struct('!BBHII') # V/P/X/CC, M/PT, sequence, timestamp, SSRC
+RTP_EXTENSION = struct.Struct('!HH')    # profile defined id, length in 32 bit words
+START_CODE    = b"\x00\x00\x00\x01"   # Annex B start code, in front of every NAL unit
+FRAME_POOL_SIZE = 4 # Frame buffers kept for reuse
+REORDER_BUFFER_SIZE = 64    # Packets held back waiting for a missing one
+REORDER_LATENCY     = 0.05  # Seconds a packet waits for a missing one at most
+MAX_DROPOUT         = 3000  # Sequence number jump taken as a restart of the stream, as RFC 3550 A.1
+RTP_PACKET_SIZE = 2048    # Largest RTP packet received over UDP
+RTP_RECV_BATCH  = 64      # Datagrams taken from the socket per wakeup at most
+RTP_RCVBUF      = 4 << 20 # UDP receive buffer asked for, room for IDR frame bursts
+RTP_TIMEOUT     = 5       # Seconds without RTP before giving up, None to wait forever
+# Ancillary count of dropped datagrams, Linux only, missing from the socket module
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40 if sys.platform.startswith('linux') else None)
+RTPMAP_RE     = re.compile(r'a=rtpmap:(?P<pt>\d+)\s+(?P<encoding>[\w.-]+)/')
+
+# extension is None or (profile id, memoryview of the extension data)
+RTPHeader = namedtuple('RTPHeader', 'version padding marker payload_type sequence '
+                                    'timestamp ssrc csrcs extension')
+FrameInfo = namedtuple('FrameInfo', 'keyframe timestamp')
+
+def parse_rtp(packet):
+    '''Splits an RTP packet (RFC 3550) into an RTPHeader and a memoryview
+       of its payload, padding removed. Nothing is copied. The header
+       format can be found from:
+       https://en.wikipedia.org/wiki/Real-time_Transport_Protocol'''
+    view = packet if isinstance(packet, memoryview) else memoryview(packet)
+    if len(view) < RTP_HEADER.size:
+        raise ValueError('RTP packet too short: %d bytes' % len(view))
+    b0, b1, sequence, timestamp, ssrc = RTP_HEADER.unpack_from(view)
+    cc = b0 & 0x0f
+    offset = RTP_HEADER.size + 4*cc
+    csrcs = struct.unpack_from('!%dI' % cc, view, RTP_HEADER.size) if cc else ()
+    extension = None
+    if b0 & 0x10:
+        profile, words = RTP_EXTENSION.unpack_from(view, offset)
+        offset += RTP_EXTENSION.size
+        extension = (profile, view[offset:offset + 4*words])
+        offset += 4*words
+    end = len(view)
+    if b0 & 0x20: # The last byte counts the padding bytes
+        end -= view[end-1]
+    if offset > end:
+        raise ValueError('RTP header longer than the packet')
+    return RTPHeader(b0 >> 6, bool(b0 & 0x20), bool(b1 & 0x80), b1 & 0x7f,
+                     sequence, timestamp, ssrc, csrcs, extension), view[offset:end]
+
+class BufferPool(object):
+    '''Bounded pool of reusable bytearrays. Buffers keep the size of the
+       largest frame they held, so once the pool is warm assembling a frame
+       copies payloads into memory that is already allocated'''
+    def __init__(self, size=FRAME_POOL_SIZE):
+        self.size  = size
+        self._free = []
+
+    def get(self):
+        return self._free.pop() if self._free else bytearray()
+
+    def put(self, buf):
+        if len(self._free) < self.size:
+            self._free.append(buf)
+
+class FrameAssembler(object):
+    '''Collects the pieces of a frame into one pooled buffer. The frame is
+       handed to the callback as a memoryview of that buffer, no copy is
+       made, so it is only valid during the call'''
+    def __init__(self, pool=None):
+        self._pool = pool or BufferPool()
+        self._buf  = None
+        self._len  = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, data):
+        if self._buf is None:
+            self._buf = self._pool.get()
+        end = self._len + len(data)
+        self._buf[self._len:end] = data # In place while the buffer is big enough
+        self._len = end
+
+    def truncate(self, length):
+        self._len = min(self._len, length)
+
+    def discard(self):
+        if self._buf is not None:
+            self._pool.put(self._buf)
+        self._buf = None
+        self._len = 0
+
+    def deliver(self, callback):
+        buf, length = self._buf, self._len
+        self._buf = None
+        self._len = 0
+        if buf is None:
+            return
+        frame = memoryview(buf)[:length]
         try:
-            while self.running:
-                #self.frame = msg = self.recv_msg()
-                msg = self._sock.recv(2048)
-                framelet = self.digestpacket(msg)
-                if framelet:
-                    self.frame += framelet
-                if self.frame and self.frame_done:
-                    self._callback(self.frame)
-                    self.frame = b''
-        except Exception as e:
-            raise Exception('Run time error: %s' % e)
-        self.running = False
-        self.close()
+            callback(frame)
+        finally:
+            frame.release()
+            try:
+                buf.append(0) # Resizing fails while views of the buffer exist
+                del buf[-1]
+            except BufferError: # The callback kept a slice, don't reuse the buffer
+                return
+            self._pool.put(buf)
 
-    def close(self):
-        self.closed  = True
-        self.running = False
-        self._sock.close()
+class ReorderBuffer(object):
+    '''Passes RTP packets on to callback(header, payload) in sequence number
+       order. A packet after a gap is held until the missing ones come, the
+       buffer is full or it waited latency seconds, then the missing ones
+       are counted as lost. Packets held are copied, so the caller can reuse
+       its receive buffer. Counts received, lost, duplicate packets and late
+       ones, that came after being counted as lost'''
+    def __init__(self, callback, size=REORDER_BUFFER_SIZE, latency=REORDER_LATENCY,
+                 clock=time.monotonic):
+        self._callback = callback
+        self.size      = size
+        self.latency   = latency
+        self._clock    = clock
+        self._packets  = {}      # sequence: (header, payload)
+        self._arrivals = deque() # (arrival time, sequence) of the packets held, oldest first
+        self._skipped  = deque(maxlen=size) # Recently lost, to tell late from duplicate
+        self._next     = None    # Next sequence number to pass on
+        self.received  = 0
+        self.lost      = 0
+        self.duplicate = 0
+        self.late      = 0
 
-    def insert_config_info(self, parameters):
-        pass
-        
-    # ********* (2) The routine for handling the RTP stream ***********
+    def __len__(self):
+        return len(self._packets)
 
-    def digestpacket(self, st):
-        """ This routine takes a UDP packet, i.e. a string of bytes and ..
-        (a) strips off the RTP header
-        (b) adds NAL "stamps" to the packets, so that they are recognized as NAL's
-        (c) Concantenates frames
-        (d) Returns a packet that can be written to disk as such and that is recognized by stock media players as h264 stream
-        """
-        startbytes = b"\x00\x00\x00\x01" # this is the sequence of four bytes that identifies a NAL packet.. must be in front of every NAL packet.
-
-        bt = bitstring.BitArray(bytes=st) # turn the whole string-of-bytes packet into a string of bits.  Very unefficient, but hey, this is only for demoing.
-        lc = 12     # bytecounter
-        bc = 12*8   # bitcounter
-
-        version   = bt[0:2].uint    # Version
-        p         = bt[3]           # Padding
-        x         = bt[4]           # Extension
-        cc        = bt[4:8].uint    # CSRC Count
-        m         = bt[9]           # Marker
-        pt        = bt[9:16].uint   # Payload Type
-        sn        = bt[16:32].uint  # Sequence number
-        timestamp = bt[32:64].uint  # Timestamp
-        ssrc      = bt[64:96].uint  # ssrc identifier
-        # The header format can be found from:
-        # https://en.wikipedia.org/wiki/Real-time_Transport_Protocol
-
-        lc = 12     # so, we have red twelve bytes
-        bc = 12*8   # .. and that many bits
-
-        if p:
-            #TODO: Deal with padding here
-            print("\n****\nPadding alert!!\n****\n")
-
-        print("*----* Packet Begin *----* (Len: {})".format(len(st)))
-        print("Ver: {}, P: {}, X: {}, CC: {}, M: {}, PT: {}".format(version,p,x,cc,m,pt))
-        print("Sequence number: {}, Timestamp: {}".format(sn,timestamp))
-        print("Sync. Source Identifier: {}".format(ssrc))
-
-        # st=f.read(4*cc) # csrc identifiers, 32 bits (4 bytes) each
-        cids = []
-        for i in range(cc):
-            cids.append(bt[bc:bc+32].uint)
-            bc += 32
-            lc += 4
-        if cids: print("CSRC Identifiers: {}".format(cids))
-
-        if (x):
-            # this section haven't been tested.. might fail
-            hid  = bt[bc:bc+16].uint
-            bc  += 16
-            lc  += 2
-
-            hlen = bt[bc:bc+16].uint
-            bc  += 16
-            lc  += 2
-
-            hst  = bt[bc:bc+32*hlen]
-            bc  += 32*hlen
-            lc  += 4*hlen
-
-            print("*----* Extension Header *----*")
-            print("Ext. Header id: {}, Header len: {}".format(hid,hlen))
+    def push(self, header, payload):
+        self.received += 1
+        seq = header.sequence
+        if self._next is None:
+            self._next = seq
+        distance = (seq - self._next) & 0xffff
+        if distance == 0:
+            self._next = (seq + 1) & 0xffff
+            self._callback(header, payload)
+            if self._packets:
+                self._release()
+                self.poll()
+            return
+        if distance >= 0x8000: # Behind the packets passed on already
+            if seq in self._skipped:
+                self._skipped.remove(seq)
+                self.late += 1
+            else:
+                self.duplicate += 1
+            return
+        if seq in self._packets:
+            self.duplicate += 1
+            return
+        if distance > MAX_DROPOUT:
+            log.debug('RTP sequence jumped from %d to %d, resyncing', self._next, seq)
+            self.flush()
+            self._next = seq
+            distance = 0
+        elif distance >= self.size:
+            self._skip_to((seq - self.size + 1) & 0xffff)
+        now = self._clock()
+        self._packets[seq] = (header, bytes(payload))
+        self._arrivals.append((now, seq))
+        self._release()
+        self.poll(now)
 
+    def poll(self, now=None):
+        '''Gives up on the missing packets that held others back longer
+           than latency'''
+        if now is None:
+            now = self._clock()
+        arrivals = self._arrivals
+        while arrivals:
+            arrival, seq = arrivals[0]
+            if seq not in self._packets:
+                arrivals.popleft()
+            elif now - arrival >= self.latency:
+                self._skip_to(seq)
+                self._release()
+            else:
+                break
+
+    def flush(self):
+        '''Passes on every packet held, counting the gaps as lost'''
+        while self._packets:
+            self._skip_to(min(self._packets, key=lambda seq: (seq - self._next) & 0xffff))
+            self._release()
+        self._arrivals.clear()
+
+    def _skip_to(self, seq):
+        packets = self._packets
+        while self._next != seq:
+            packet = packets.pop(self._next, None)
+            if packet:
+                self._callback(*packet)
+            else:
+                self.lost += 1
+                self._skipped.append(self._next)
+            self._next = (self._next + 1) & 0xffff
+
+    def _release(self):
+        packets = self._packets
+        while self._next in packets:
+            header, payload = packets.pop(self._next)
+            self._next = (self._next + 1) & 0xffff
+            self._callback(header, payload)
+
+class Depacketizer(abc.ABC):
+    '''Reassembles the RTP packets of one video stream into frames (access
+       units) of Annex B NAL units, handed to the callback as a memoryview
+       of a pooled buffer, see FrameAssembler. A frame ends with the marker
+       bit or when the timestamp changes. A fragmented NAL unit missing
+       packets, by a gap in the sequence numbers, is dropped'''
+    KEYFRAME_TYPES = frozenset()
+
+    def __init__(self, callback=None, pool=None):
+        self._callback  = callback or (lambda frame: None)
+        self._frame     = FrameAssembler(pool)
+        self._timestamp = None
+        self._sequence  = None  # Next sequence number expected
+        self._keyframe  = False
+        self._fu_start  = None  # Where the fragmented NAL unit being assembled starts
+        self.frame_info = None  # FrameInfo of the last frame delivered
+
+    def process_packet(self, st):
+        '''Feeds one RTP packet. Returns the FrameInfo of the frame it
+           completed, after calling back with it, or None'''
+        try:
+            header, payload = parse_rtp(st)
+        except (ValueError, struct.error) as e:
+            log.debug('Dropping malformed RTP packet: %s', e)
+            return None
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('RTP packet (len %d): %s', len(st), header)
+        return self.process(header, payload)
+
+    def process(self, header, payload):
+        info = None
+        if header.sequence != self._sequence and self._sequence is not None:
+            log.debug('RTP sequence gap: expected %d, got %d', self._sequence, header.sequence)
+            self._drop_fragment()
+        self._sequence = (header.sequence + 1) & 0xffff
+        if header.timestamp != self._timestamp:
+            info = self.flush()
+            self._timestamp = header.timestamp
+        if payload:
+            self.depacketize(payload)
+        if header.marker:
+            info = self.flush() or info
+        return info
+
+    def flush(self):
+        '''Delivers what was assembled of the current frame'''
+        self._drop_fragment() # Its last fragment never came
+        keyframe, self._keyframe = self._keyframe, False
+        if not len(self._frame):
+            return None
+        info = self.frame_info = FrameInfo(keyframe, self._timestamp)
+        self._frame.deliver(self._callback)
+        return info
+
+    @abc.abstractmethod
+    def depacketize(self, payload):
+        '''Appends the NAL units, or fragment, of one payload to the frame'''
+
+    @abc.abstractmethod
+    def nal_type(self, first_byte):
+        '''NAL unit type from the first byte of its header'''
+
+    def _unit(self, nal, nal_type):
+        self._frame.append(START_CODE)
+        self._frame.append(nal)
+        if nal_type in self.KEYFRAME_TYPES:
+            self._keyframe = True
+
+    def _aggregate(self, payload, pos):
+        '''Aggregation packet from pos on: 16 bit size, NAL unit, ...'''
+        end = len(payload)
+        while pos + 2 < end:
+            size = (payload[pos] << 8) | payload[pos+1]
+            pos += 2
+            if not size or pos + size > end:
+                log.debug('Malformed aggregation packet')
+                return
+            self._unit(payload[pos:pos+size], self.nal_type(payload[pos]))
+            pos += size
+
+    def _fragment(self, start, end, nal_header, data, nal_type):
+        if start:
+            self._drop_fragment()
+            self._fu_start = len(self._frame)
+            self._frame.append(START_CODE)
+            self._frame.append(nal_header)
+        elif self._fu_start is None: # Its first fragment was lost
+            return
+        self._frame.append(data)
+        if end:
+            self._fu_start = None
+            if nal_type in self.KEYFRAME_TYPES:
+                self._keyframe = True
+
+    def _drop_fragment(self):
+        if self._fu_start is not None:
+            self._frame.truncate(self._fu_start)
+            self._fu_start = None
+
+class H264Depacketizer(Depacketizer):
+    '''RFC 6184, single NAL unit and non-interleaved mode'''
+    KEYFRAME_TYPES = frozenset((5,)) # IDR slice
+
+    def nal_type(self, first_byte):
+        return first_byte & 0x1f
+
+    def depacketize(self, payload):
         # OK, now we enter the NAL packet, as described here:
         # 
         # https://tools.ietf.org/html/rfc6184#section-1.3
@@ -165,51 +376,183 @@ class RTPReceive(threading.Thread):
         Other bytes: [... VIDEO FRAGMENT DATA...]
         """
 
-        fb   = bt[bc] # i.e. "F"
-        nri  = bt[bc+1:bc+3].uint # "NRI"
-        nlu0 = bt[bc:bc+3] # "3 NAL UNIT BITS" (i.e. [F | NRI])
-        typ  = bt[bc+3:bc+8].uint # "Type"
-        print("   *-* NAL Header *-*")
-        print("F: {}, NRI: {}, Type: {}".format(fb, nri, typ))
-        print("First three bits together : {}".format(bt[bc:bc+3]))
-
-        if (typ==7 or typ==8):
-            # this means we have either an SPS or a PPS packet
+        nal_header = payload[0] # [F | NRI | Type]
+        typ = nal_header & 0x1f
+        if 0 < typ < 24:
+            # A single NAL unit, SPS (7) and PPS (8) included
             # they have the meta-info about resolution, etc.
             # more reading for example here:
             # http://www.cardinalpeak.com/blog/the-h-264-sequence-parameter-set/
-            if (typ==7):
-                print(">>>>> SPS packet")
-            else:
-                print(">>>>> PPS packet")
-            return startbytes+st[lc:]
-            # .. notice here that we include the NAL starting sequence "startbytes" and the "First byte"
-
-        bc += 8; 
-        lc += 1; # let's go to "Second byte"
-        # ********* WE ARE AT THE "Second byte" ************
-        # The "Type" here is most likely 28, i.e. "FU-A"
-        start = bt[bc] # start bit
-        end   = bt[bc+2] # end bit
-        nlu1  = bt[bc+3:bc+8] # 5 nal unit bits
-        head = b""
-
-        if (self.frame_done and start): # OK, this is a first fragment in a movie frame
-            print(">>> first fragment found")
-            self.frame_done = False
-            nlu  = nlu0+nlu1 # Create "[3 NAL UNIT BITS | 5 NAL UNIT BITS]"
-            print("  >>> NLU0: {}, NLU1: {}, NLU: {}".format(nlu0,nlu1,nlu))
-            head = startbytes+nlu.bytes # .. add the NAL starting sequence
-            lc  += 1 # We skip the "Second byte"
-        elif (self.frame_done==False and start==False and end==False): # intermediate fragment in a sequence, just dump "VIDEO FRAGMENT DATA"
-            lc  += 1 # We skip the "Second byte"
-        elif (self.frame_done==False and end==True): # last fragment in a sequence, just dump "VIDEO FRAGMENT DATA"
-            print("<<<< last fragment found")
-            self.frame_done = True
-            lc  += 1 # We skip the "Second byte"
-
-        if (typ==28): # This code only handles "Type" = 28, i.e. "FU-A"
-            return head+st[lc:]
-        else:
-            #raise Exception("unknown frame type for this piece of s***")
-            return None
+            self._unit(payload, typ)
+        elif typ == 24: # STAP-A
+            self._aggregate(payload, 1)
+        elif typ == 28 and len(payload) > 2: # FU-A
+            # ********* WE ARE AT THE "Second byte" ************
+            fu_header = payload[1]
+            nal_type = fu_header & 0x1f
+            # Rebuild the NAL header: [3 NAL UNIT BITS | 5 NAL UNIT BITS]
+            self._fragment(fu_header & 0x80, fu_header & 0x40,
+                           bytes(((nal_header & 0xe0) | nal_type,)), payload[2:], nal_type)
+        # STAP-B, MTAP and FU-B are only allowed in interleaved mode
+
+class H265Depacketizer(Depacketizer):
+    '''RFC 7798, without DONL fields (sprop-max-don-diff=0)'''
+    KEYFRAME_TYPES = frozenset(range(16, 22)) # IRAP pictures: BLA, IDR, CRA
+
+    def nal_type(self, first_byte):
+        return (first_byte >> 1) & 0x3f
+
+    def depacketize(self, payload):
+        # NAL unit header: [F | 6 bits Type | 6 bits LayerId | 3 bits TID]
+        if len(payload) < 3:
+            return
+        typ = (payload[0] >> 1) & 0x3f
+        if typ < 48:
+            self._unit(payload, typ)
+        elif typ == 48: # Aggregation packet
+            self._aggregate(payload, 2)
+        elif typ == 49: # Fragmentation unit, FU header: [S | E | 6 bits FuType]
+            fu_header = payload[2]
+            nal_type = fu_header & 0x3f
+            self._fragment(fu_header & 0x80, fu_header & 0x40,
+                           bytes(((payload[0] & 0x81) | (nal_type << 1), payload[1])),
+                           payload[3:], nal_type)
+        # PACI (50) is not supported
+
+DEPACKETIZERS = {'H264': H264Depacketizer, 'H265': H265Depacketizer}
+
+def get_depacketizer(sdp=None, callback=None, pool=None):
+    '''Depacketizer for the first encoding of the SDP rtpmap lines that has
+       one, H.264 when there is none'''
+    for pt, encoding in RTPMAP_RE.findall(sdp or ''):
+        if encoding.upper() in DEPACKETIZERS:
+            return DEPACKETIZERS[encoding.upper()](callback, pool)
+    return H264Depacketizer(callback, pool)
+
+class RTPReceive(threading.Thread):
+    '''
+    This will open a socket on the client ports sent in RTSP setup request and
+    return data as its received to the callback function. 
+    The callback gets each frame as a memoryview of a pooled buffer,
+    valid only during the call: copy it with bytes() to keep it.
+    The codec is taken from the rtpmap of the sdp, H.264 by default.
+    Packets are put back in order first, waiting for a missing one up to
+    latency seconds; reorder holds the lost, duplicate and late counts.
+    Each wakeup takes every datagram queued on the socket, up to batch,
+    into preallocated buffers. The socket buffer is asked to be rcvbuf
+    bytes, RTP_RCVBUF by default, 0 keeps the system one; a smaller buffer
+    granted is only warned about when rcvbuf was given. kernel_drops counts the datagrams the
+    kernel dropped with the socket buffer full, None where it doesn't tell.
+    Per packet details are logged at DEBUG level on the "rtp" logger.
+    '''
+    def __init__(self, client_ports, callback=None, sdp=None, latency=REORDER_LATENCY,
+                 timeout=RTP_TIMEOUT, rcvbuf=None, batch=RTP_RECV_BATCH):
+        threading.Thread.__init__(self)
+        self._callback = callback or (lambda x: None)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(("", client_ports[0])) # we open a port that is visible to the whole internet (the empty string "" takes care of that)
+        self._sock.setblocking(False)
+        self.timeout    = timeout # if the socket is dead for timeout s., its thrown into trash
+        asked = RTP_RCVBUF if rcvbuf is None else rcvbuf
+        if asked:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, asked)
+        # Linux doubles the size asked for, but caps it at net.core.rmem_max
+        self.rcvbuf     = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if self.rcvbuf < asked:
+            log.log(logging.DEBUG if rcvbuf is None else logging.WARNING,
+                    'UDP receive buffer is %d bytes, %d asked for', self.rcvbuf, asked)
+        self.kernel_drops = None
+        self._ancbufsize  = 0
+        if SO_RXQ_OVFL is not None:
+            try:
+                self._sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self.kernel_drops = 0
+                self._ancbufsize  = socket.CMSG_SPACE(4)
+            except OSError:
+                pass
+        buffers = memoryview(bytearray(batch * RTP_PACKET_SIZE))
+        self._buffers = [buffers[i:i+RTP_PACKET_SIZE]
+                         for i in range(0, len(buffers), RTP_PACKET_SIZE)]
+        self._selector  = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        # close() from another thread writes to it to wake select()
+        self._wakeup, self._wakeup_w = socket.socketpair()
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self.closed     = False
+        self.depacketizer = get_depacketizer(sdp, self._callback)
+        self.reorder    = ReorderBuffer(self.depacketizer.process, latency=latency)
+        self.running    = False
+        self.sprop_parameter_sets = 'Z0IAIJWoFAHmQA==,aM48gA=='
+        self.start()
+
+    def run(self):
+        self.running = True
+        try:
+            while self.running:
+                held = len(self.reorder)
+                events = self._selector.select(self.reorder.latency if held else self.timeout)
+                if not self.running:
+                    break
+                if events:
+                    for packet in self.receive():
+                        self.process_packet(packet)
+                elif held:
+                    self.reorder.poll()
+                else:
+                    raise socket.timeout('no RTP for %s s' % self.timeout)
+            # Closed: pass on the packets held and the frame assembled
+            self.reorder.flush()
+            self.depacketizer.flush()
+        except Exception as e:
+            raise Exception('Run time error: %s' % e)
+        finally:
+            self.closed  = True
+            self.running = False
+            self._selector.close()
+            self._sock.close()
+            self._wakeup.close()
+            self._wakeup_w.close()
+
+    def receive(self):
+        '''Takes the datagrams queued on the socket, without waiting, up to
+           a batch. They are memoryviews of the receive buffers, valid until
+           the next call'''
+        packets = []
+        for buf in self._buffers:
+            try:
+                if self._ancbufsize:
+                    size, ancdata, flags, addr = self._sock.recvmsg_into([buf], self._ancbufsize)
+                    for level, kind, data in ancdata: # Only there once a datagram was dropped
+                        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                            self.kernel_drops = int.from_bytes(data[:4], sys.byteorder)
+                else:
+                    size = self._sock.recv_into(buf)
+            except (BlockingIOError, InterruptedError):
+                break
+            packets.append(buf[:size])
+        return packets
+
+    def close(self):
+        '''Stops the thread, which closes the socket on its way out'''
+        self.running = False
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError: # Already stopped
+            pass
+
+    def insert_config_info(self, parameters):
+        pass
+        
+    # ********* (2) The routine for handling the RTP stream ***********
+
+    def process_packet(self, st):
+        '''Feeds one RTP packet, through the reorder buffer, to the
+           depacketizer'''
+        try:
+            header, payload = parse_rtp(st)
+        except (ValueError, struct.error) as e:
+            log.debug('Dropping malformed RTP packet: %s', e)
+            return
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('RTP packet (len %d): %s', len(st), header)
+        self.reorder.push(header, payload)
@@ -11,8 +11,10 @@
 # Ported to Python3, removed GoodThread
 # -killian441
 
-import ast, datetime, re, socket, threading, time, traceback
-from hashlib import md5
+import asyncio, base64, binascii, datetime, errno, heapq, itertools, os, re, selectors, socket, sys, threading, time, traceback
+from collections import namedtuple
+from concurrent.futures import Future
+from hashlib import md5, sha256
 try:
     from urllib.parse import urlparse
 except ImportError:
@@ -31,15 +33,280 @@ DEFAULT_USERAGENT   = 'Python Rtsp Client 1.0'
 DEFAULT_SERVER_PORT = 554
 END_OF_LINE         = '\r\n'
 HEADER_END_STR      = END_OF_LINE*2
+HEADER_END_BYTES    = HEADER_END_STR.encode()
+RECV_BUFFER_SIZE    = 65536 # One recv drains a burst of interleaved RTP
+HAPPY_EYEBALLS_DELAY = 0.25 # Seconds before racing the next address (RFC 8305)
+
+TRACK_ID_RE         = re.compile(r'a=control:(?P<trackid>[\w=\d]+)')
+AUTH_TOKEN_RE       = re.compile(r'[\s,]*([^\s=,]+)(?:\s*=\s*("(?:[^"\\]|\\.)*"|[^\s,]*))?')
+QUOTED_PAIR_RE      = re.compile(r'\\(.)')
+DIGEST_HASHES       = {'MD5': md5, 'MD5-SESS': md5, 'SHA-256': sha256, 'SHA-256-SESS': sha256}
+
+def parse_header(header):
+    '''Splits the header section of an RTSP message, without the blank
+       line ending it, in one pass. Returns (start line, {lowercased header: value})'''
+    lines = header.split(END_OF_LINE)
+    headers = {}
+    for line in lines[1:]:
+        key, sep, val = line.partition(':')
+        if sep:
+            key = key.strip().lower()
+            if key in headers: # Repeated header, e.g. one WWW-Authenticate per scheme
+                headers[key] += ', ' + val.strip()
+            else:
+                headers[key] = val.strip()
+    return lines[0], headers
+
+class RTSPMessage(namedtuple('RTSPMessage', 'header start_line headers body')):
+    '''A message read by RTSPFramer: its header section as text, parsed
+       into the start line and {lowercased header: value}, and its body.
+       str() gives the whole message back'''
+    __slots__ = ()
+
+    def __str__(self):
+        return self.header + HEADER_END_STR + self.body
+
+def parse_challenges(value):
+    '''Parses a WWW-Authenticate value, which may hold several challenges,
+       into [(lowercased scheme, {lowercased param: unquoted value})]'''
+    challenges = []
+    pos = 0
+    while True:
+        m = AUTH_TOKEN_RE.match(value, pos)
+        if not m or m.end() == pos:
+            return challenges
+        pos = m.end()
+        name, val = m.group(1), m.group(2)
+        if val is None:
+            challenges.append((name.lower(), {}))
+        elif challenges:
+            if val.startswith('"'):
+                val = QUOTED_PAIR_RE.sub(r'\1', val[1:-1])
+            challenges[-1][1][name.lower()] = val
+
+class AuthChallenge(object):
+    '''A challenge an RTSP server answered 401 with. Kept per host in
+       auth_cache so later connections authenticate their first request'''
+    __slots__ = ('scheme', 'realm', 'nonce', 'algorithm', 'opaque', 'qop', 'nc')
+
+    def __init__(self, scheme, params):
+        self.scheme    = scheme
+        self.realm     = params.get('realm', '')
+        self.nonce     = params.get('nonce', '')
+        self.algorithm = params.get('algorithm', 'MD5').upper()
+        self.opaque    = params.get('opaque')
+        self.qop       = 'auth' if 'qop' in params else None
+        self.nc        = 0 # Requests sent with this nonce, for qop=auth
+
+def select_challenge(value):
+    '''The strongest supported challenge of a WWW-Authenticate value:
+       Digest SHA-256, then Digest MD5, then Basic. None if none is usable'''
+    best, best_rank = None, -1
+    for scheme, params in parse_challenges(value):
+        if scheme == 'digest':
+            algorithm = params.get('algorithm', 'MD5').upper()
+            qops = [q.strip() for q in params.get('qop', 'auth').split(',')]
+            if algorithm not in DIGEST_HASHES or 'nonce' not in params or 'auth' not in qops:
+                continue
+            rank = 2 if algorithm.startswith('SHA-256') else 1
+        elif scheme == 'basic':
+            rank = 0
+        else:
+            continue
+        if rank > best_rank:
+            best, best_rank = AuthChallenge(scheme, params), rank
+    return best
+
+auth_cache  = {} # {(host, port, username): AuthChallenge} shared by every client
+_auth_lock  = threading.Lock()
 
 #x-notice in ANNOUNCE, BOS-Begin of Stream, EOS-End of Stream
 X_NOTICE_EOS, X_NOTICE_BOS, X_NOTICE_CLOSE = 2101, 2102, 2103
 
+RTSPResponse = namedtuple('RTSPResponse', 'status headers body')
+# A request in flight, `future` resolves with its RTSPResponse. `replay`
+# marks the copy resent after a 401, which is not retried again. Once sent
+# `signed` is the challenge its Authorization answered, None without one,
+# and `sent` the time.monotonic() it went out
+RTSPRequest  = namedtuple('RTSPRequest', 'method url headers future replay signed sent',
+                          defaults=(None, None))
+# Requests that must carry the Session header once a SETUP is pending
+SESSION_METHODS = ('SETUP', 'PLAY', 'PAUSE', 'RECORD', 'TEARDOWN', 'GET_PARAMETER')
+
 class RTSPError(Exception): pass
 class RTSPURLError(RTSPError): pass
 class RTSPNetError(RTSPError): pass
 
-class RTSPClient(threading.Thread):
+class RTSPFramer(object):
+    '''Incremental demuxer for the bytes read from an RTSP connection.
+       Data is appended to one bytearray and consumed through a read offset,
+       the buffer is compacted once per call, not once per frame.
+       The header terminator is only searched in bytes not scanned before.
+       The header section alone is decoded and parsed, once, as soon as it
+       is complete; Content-Length comes from it and the body is decoded
+       on its own.
+       Interleaved '$' frames go to the callback set for their channel,
+       or the catch-all interleaved_callback, as a memoryview into the
+       buffer: no copy is made, so it is only valid during the call.
+       Callbacks that keep the payload must copy it with bytes()'''
+    def __init__(self, interleaved_callback=None):
+        self.buf = bytearray()
+        self._interleaved_callback = interleaved_callback
+        self._channel_callbacks = {} # {channel: callback(channel, memoryview)}
+        self._scan_pos = 0     # Where the next search for CRLFCRLF starts
+        self._msg_len  = None  # Length of the pending message once its header is complete
+        self._header   = None  # (header text, start line, headers) of the pending message
+        self._body_len = 0
+
+    def set_channel_callback(self, channel, callback):
+        '''Routes interleaved frames of one channel, None removes the route'''
+        if callback is None:
+            self._channel_callbacks.pop(channel, None)
+        else:
+            self._channel_callbacks[channel] = callback
+
+    def feed(self, data):
+        self.buf += data
+
+    def clear(self):
+        del self.buf[:]
+        self._scan_pos = 0
+        self._msg_len  = None
+        self._header   = None
+
+    def next_msg(self):
+        '''Returns the next complete RTSP message as an RTSPMessage, or None
+           if more data is needed'''
+        buf = self.buf
+        pos = 0 # Consumed so far
+        msg = None
+        view = None # Over the whole buffer, sliced for each frame
+        while pos < len(buf):
+            if self._msg_len is None and buf[pos] == 0x24: # '$'
+                if len(buf) - pos < 4:
+                    break
+                end = pos + 4 + ((buf[pos+2] << 8) | buf[pos+3])
+                if len(buf) < end:
+                    break
+                channel = buf[pos+1]
+                callback = self._channel_callbacks.get(channel, self._interleaved_callback)
+                if callback:
+                    if view is None:
+                        view = memoryview(buf)
+                    callback(channel, view[pos+4:end])
+                pos = end
+                continue
+            if self._msg_len is None:
+                end = buf.find(HEADER_END_BYTES, max(pos, self._scan_pos))
+                if end < 0:
+                    # The terminator may straddle the next chunk
+                    self._scan_pos = max(pos, len(buf) - 3)
+                    break
+                header = buf[pos:end].decode('utf-8', 'replace')
+                start_line, headers = parse_header(header)
+                length = headers.get('content-length', '')
+                self._header = (header, start_line, headers)
+                self._body_len = int(length) if length.isdigit() else 0
+                self._msg_len = end + 4 - pos + self._body_len
+            if len(buf) - pos < self._msg_len:
+                break
+            pos += self._msg_len
+            body = buf[pos-self._body_len:pos].decode('utf-8', 'replace') if self._body_len else ''
+            msg = RTSPMessage(*self._header, body)
+            self._msg_len = self._header = None
+            break
+        if view is not None:
+            view.release()
+        self._compact(pos)
+        return msg
+
+    def _compact(self, pos):
+        if not pos:
+            return
+        try:
+            del self.buf[:pos]
+        except BufferError: # A callback kept a view of the payload
+            self.buf = self.buf[pos:]
+        self._scan_pos = max(0, self._scan_pos - pos)
+
+def _interleave_families(infos):
+    '''Alternates address families, keeping the resolver order within each'''
+    families = {}
+    for info in infos:
+        families.setdefault(info[0], []).append(info)
+    queues = list(families.values())
+    ordered = []
+    while queues:
+        for queue in list(queues):
+            ordered.append(queue.pop(0))
+            if not queue:
+                queues.remove(queue)
+    return ordered
+
+def connect_tcp(host, port, timeout=None, delay=HAPPY_EYEBALLS_DELAY):
+    '''Non-blocking connect in the Happy Eyeballs style (RFC 8305): the
+       resolved IPv6 and IPv4 addresses are tried alternately, a new attempt
+       starts every `delay` seconds or as soon as the previous one fails,
+       and the first socket to connect wins. Raises socket.timeout once
+       `timeout` seconds have passed without a connection'''
+    deadline = None if timeout is None else time.monotonic() + timeout
+    infos = _interleave_families(socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM))
+    selector = selectors.DefaultSelector()
+    error = None
+    next_start = 0
+    try:
+        while True:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise socket.timeout('timed out')
+            if infos and (now >= next_start or not selector.get_map()):
+                family, type, proto, canonname, addr = infos.pop(0)
+                sock = socket.socket(family, type, proto)
+                sock.setblocking(False)
+                err = sock.connect_ex(addr)
+                if err == 0:
+                    sock.setblocking(True)
+                    return sock
+                if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    sock.close()
+                    error = socket.error(err, os.strerror(err))
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE)
+                next_start = now + delay
+                continue
+            if not selector.get_map():
+                raise error or socket.error('No address found for %s' % host)
+            wait = next_start - now if infos else None
+            if deadline is not None:
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+            for key, mask in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    sock.setblocking(True)
+                    return sock
+                sock.close()
+                error = socket.error(err, os.strerror(err))
+                next_start = 0 # Failed early, race the next address now
+    finally:
+        # Attempts that lost the race
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+def _chain_future(source, target):
+    if target.done():
+        return
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+class RTSPClientBase(object):
+    '''URL, SDP and authentication handling shared by RTSPClient and
+       AsyncRTSPClient. Subclasses provide _parsed_url, _cseq, _session_id,
+       _dest_ip and _orig_url'''
     TRANSPORT_TYPE_LIST = []
     NAT_IP_PORT         = ''
     ENABLE_ARQ          = False
@@ -47,12 +314,279 @@ class RTSPClient(threading.Thread):
     HEARTBEAT_INTERVAL  = 10 # 10s
     CLIENT_PORT_RANGE   = '10014-10015'
 
-    def __init__(self, url, dest_ip='', callback=None, socks=None, choose_transport=None):
+    def _parse_url(self, url):
+        '''Resolve url, return the urlparse object'''
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        ip = parsed.hostname
+        port = parsed.port and int(parsed.port) or DEFAULT_SERVER_PORT
+        target = parsed.path
+        if parsed.query:
+            target += '?' + parsed.query
+        if parsed.fragment:
+            target += '#' + parsed.fragment
+
+        if not scheme:
+            raise RTSPURLError('Bad URL "%s"' % url)
+        if scheme not in ('rtsp',): # 'rtspu'):
+            raise RTSPURLError('Unsupported scheme "%s" \
+                                in URL "%s"' % (scheme, url))
+        if not ip or not target:
+            raise RTSPURLError('Invalid url: %s (host="%s" \
+                                port=%u target="%s")' %
+                                (url, ip, port, target))
+        return parsed
+
+    def _update_content_base(self, headers):
+        base = headers.get('content-base')
+        if base:
+            if base[-1] == '/':
+                base = base[:-1]
+            self._orig_url = base
+
+    def _auth_key(self):
+        return (self._parsed_url.hostname, self._server_port, self._parsed_url.username)
+
+    def _cached_challenge(self):
+        with _auth_lock:
+            return auth_cache.get(self._auth_key())
+
+    def _add_auth(self, value, signed):
+        '''Takes the WWW-Authenticate value of a 401 response and caches its
+           challenge for the host. signed is the challenge the rejected
+           request answered, None if it had no Authorization. Returns True
+           when the request is worth sending again: it had none or the nonce
+           changed since (stale). The same nonce rejected again means bad
+           credentials'''
+        challenge = select_challenge(value)
+        if challenge is None:
+            raise RTSPError('Authentication failure, unsupported challenge: %s' % value)
+        if not self._parsed_url.username:
+            raise RTSPError('Authentication required, no username provided')
+        self._challenge = challenge
+        with _auth_lock:
+            auth_cache[self._auth_key()] = challenge
+        return signed is None or signed.scheme != challenge.scheme or \
+               signed.nonce != challenge.nonce
+
+    def _authorization(self, method, uri, challenge=None):
+        '''Authorization header value for a request answering challenge, the
+           latest one of this host by default. None until one is known'''
+        challenge = challenge or self._challenge
+        if challenge is None:
+            return None
+        if challenge.scheme == 'basic':
+            credentials = '%s:%s' % (self._parsed_url.username, self._parsed_url.password)
+            return 'Basic ' + base64.b64encode(credentials.encode()).decode()
+        return self._auth_digest(challenge, method, uri)
+
+    def _auth_digest(self, challenge, method, uri):
+        '''Digest authorization (RFC 2617/7616) with MD5 or SHA-256, the
+           -sess variants and qop=auth'''
+        H = lambda data: DIGEST_HASHES[challenge.algorithm](data.encode()).hexdigest()
+        username = self._parsed_url.username
+        HA1 = H('%s:%s:%s' % (username, challenge.realm, self._parsed_url.password))
+        cnonce = binascii.hexlify(os.urandom(8)).decode()
+        if challenge.algorithm.endswith('-SESS'):
+            HA1 = H('%s:%s:%s' % (HA1, challenge.nonce, cnonce))
+        HA2 = H('%s:%s' % (method, uri))
+        auth = 'Digest username="%s", realm="%s", nonce="%s", uri="%s", algorithm=%s' % \
+               (username, challenge.realm, challenge.nonce, uri, challenge.algorithm)
+        if challenge.qop:
+            with _auth_lock:
+                challenge.nc += 1
+                nc = '%08x' % challenge.nc
+            response = H('%s:%s:%s:%s:%s:%s' % (HA1, challenge.nonce, nc, cnonce,
+                                                challenge.qop, HA2))
+            auth += ', qop=%s, nc=%s, cnonce="%s"' % (challenge.qop, nc, cnonce)
+        else:
+            response = H('%s:%s:%s' % (HA1, challenge.nonce, HA2))
+        auth += ', response="%s"' % response
+        if challenge.opaque is not None:
+            auth += ', opaque="%s"' % challenge.opaque
+        return auth
+
+    def _get_time_str(self):
+        '''Python 2.6 and above only supports %f parameters,
+           compatible with the lower version with the following wording'''
+        dt = datetime.datetime.now()
+        return dt.strftime('%Y-%m-%d %H:%M:%S.') + str(dt.microsecond)
+
+    def _parse_response(self, msg):
+        '''Resolve the response message'''
+        version, status = msg.start_line.split(None, 2)[:2]
+        return int(status), msg.headers, msg.body
+
+    def _parse_track_id(self, sdp):
+        '''Resolves a string of the form trackID = 2 from sdp'''
+        self.track_id_lst = TRACK_ID_RE.findall(sdp)
+
+    def _next_seq(self):
+        self._cseq += 1
+        return self._cseq
+
+    def _get_transport_type(self):
+        '''The Transport string parameter that is required to get SETUP'''
+        transport_str = ''
+        ip_type = 'unicast' #TODO: if IPAddress(DEST_IP).is_unicast() 
+                            #      else 'multicast'
+        for t in self.TRANSPORT_TYPE_LIST:
+            if t not in TRANSPORT_TYPE_MAP:
+                raise RTSPError('Error param: %s' % t)
+            if t.endswith('tcp'):
+                transport_str +=TRANSPORT_TYPE_MAP[t]%ip_type
+            else:
+                transport_str +=TRANSPORT_TYPE_MAP[t]%(ip_type, 
+                                                       self._dest_ip, 
+                                                       self.CLIENT_PORT_RANGE)
+        return transport_str
+
+    def set_channel_callback(self, channel, callback):
+        '''Receives (channel, memoryview) for each interleaved frame of one
+           channel, e.g. 0 for RTP and 1 for RTCP of the first SETUP. The
+           view is only valid during the call'''
+        self._framer.set_channel_callback(channel, callback)
+
+    def _format_request(self, method, url, headers):
+        '''Adds the common headers, returns (CSeq, request text, challenge
+           its Authorization answers or None)'''
+        msg = '%s %s %s'%(method, url, RTSP_VERSION)
+        headers['User-Agent'] = DEFAULT_USERAGENT
+        cseq = self._next_seq()
+        headers['CSeq'] = str(cseq)
+        signed = self._challenge
+        if signed is not None:
+            headers['Authorization'] = self._authorization(method, url, signed)
+        if self._session_id:
+            headers['Session'] = self._session_id
+        for (k, v) in list(headers.items()):
+            msg += END_OF_LINE + '%s: %s'%(k, str(v))
+        msg += HEADER_END_STR # End headers
+        return cseq, msg, signed
+
+class RTSPEngine(threading.Thread):
+    '''Drives many RTSPClient connections from a single selector thread
+       instead of one receive thread per client. Clients keep their
+       blocking sockets and do_* API; the engine only reads from sockets
+       the selector reports readable, and runs keepalive timers'''
+    def __init__(self):
         threading.Thread.__init__(self)
-        self._auth        = None
+        self.daemon    = True
+        self.running   = True
+        self._selector = selectors.DefaultSelector()
+        self._lock     = threading.Lock()
+        self._changes  = [] # (client, add) applied by the engine thread, in order
+        self._timers   = [] # heap of (when, seq, fn)
+        self._seq      = itertools.count()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self.start()
+
+    def add(self, client):
+        self._change(client, True)
+
+    def remove(self, client):
+        '''The engine unregisters and closes the client socket, so its fd
+           can't be reused while still registered'''
+        self._change(client, False)
+
+    def call_later(self, delay, fn):
+        with self._lock:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._seq), fn))
+        self._wake()
+
+    def stop(self):
+        self.running = False
+        self._wake()
+
+    def _change(self, client, add):
+        with self._lock:
+            self._changes.append((client, add))
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except socket.error: # Already full, the engine will wake up anyway
+            pass
+
+    def run(self):
+        while self.running:
+            with self._lock:
+                changes, self._changes = self._changes, []
+                timeout = max(0, self._timers[0][0] - time.monotonic()) if self._timers else None
+            for client, add in changes:
+                if add:
+                    self._selector.register(client._sock, selectors.EVENT_READ, client)
+                else:
+                    try:
+                        self._selector.unregister(client._sock)
+                    except (KeyError, ValueError):
+                        pass
+                    client._sock.close()
+            if changes:
+                continue
+            for key, mask in self._selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except socket.error:
+                        pass
+                    continue
+                try:
+                    key.data._on_readable()
+                except Exception as e:
+                    key.data._callback('Engine error: %s' % e)
+                    key.data.close()
+            self._run_timers()
+        for key in list(self._selector.get_map().values()):
+            key.fileobj.close()
+        self._selector.close()
+        self._wake_w.close()
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > now:
+                    return
+                when, seq, fn = heapq.heappop(self._timers)
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+_default_engine      = None
+_default_engine_lock = threading.Lock()
+
+def get_default_engine():
+    '''Process-wide RTSPEngine, started on first use'''
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None or not _default_engine.running:
+            _default_engine = RTSPEngine()
+        return _default_engine
+
+class RTSPClient(threading.Thread, RTSPClientBase):
+    def __init__(self, url, dest_ip='', callback=None, socks=None, choose_transport=None,
+                 interleaved_callback=None, engine=None, connect_timeout=None, timeout=None):
+        threading.Thread.__init__(self)
+        self._engine      = engine # None: this client runs its own receive thread
+        self.connect_timeout = connect_timeout
+        self.timeout      = timeout # Bounds each send and the wait for each answer, None waits forever
         self._callback    = callback or (lambda x: x)
+        # Receives (channel, memoryview) for '$'-framed RTP/RTCP on channels
+        # without their own set_channel_callback()
+        self._interleaved_callback = interleaved_callback
         self._cseq        = 0
-        self._cseq_map    = {} # {CSeq:Method} mapping
+        self._lock        = threading.RLock() # Callers, timers and the receiver all send
+        self._pending     = {} # {CSeq:RTSPRequest} sent, waiting for their response
+        self._queued      = [] # RTSPRequests waiting for the session of the first SETUP
+        self._setup_cseq  = None # CSeq of the SETUP that will establish the session
+        self._keepalive_method = 'GET_PARAMETER' # OPTIONS for servers without it
         self._dest_ip     = dest_ip
         self._parsed_url  = self._parse_url(url)
         self._server_port = self._parsed_url.port or DEFAULT_SERVER_PORT
@@ -60,6 +594,7 @@ class RTSPClient(threading.Thread):
                             self._parsed_url.hostname + \
                             ":" + str(self._server_port) + \
                             self._parsed_url.path
+        self._challenge   = self._cached_challenge()
         self._session_id  = ''
         self._sock        = None
         self._socks        = socks
@@ -67,7 +602,7 @@ class RTSPClient(threading.Thread):
         self.cur_scale    = 1
         self.location     = ''
         self.response     = None
-        self.response_buf = []
+        self._framer      = RTSPFramer(self._interleaved_callback)
         self.running      = True
         self.state        = None
         self.choose_transport = choose_transport
@@ -77,7 +612,10 @@ class RTSPClient(threading.Thread):
         self._connect_server()
         self._update_dest_ip()
         self.closed = False
-        self.start()
+        if self._engine:
+            self._engine.add(self)
+        else:
+            self.start()
 
     def __enter__(self):
         return self
@@ -86,80 +624,90 @@ class RTSPClient(threading.Thread):
         self.close()
 
     def flush(self):
-        while self.response_buf:
-            x = self.response_buf.pop()
-            del x
+        self._framer.clear()
 
-    def set_cache(self, s):
-        self.flush()
-        self.response_buf.append(s)
-
-    def cache(self, s=None):
-        if s is None:
-            return ''.join(self.response_buf)
-        else:
-            self.response_buf.append(s)
+    def cache(self):
+        return self._framer.buf.decode('utf-8', 'replace')
 
     def close(self):
         if not self.closed:
             self.closed  = True
             self.running = False
             self.state   = 'closed'
-            self._sock.close()
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR) # wakes up the recv thread
+            except socket.error:
+                pass
+            if self._engine:
+                self._engine.remove(self)
+            else:
+                self._sock.close()
+            # Nobody is going to answer the requests still in flight
+            with self._lock:
+                requests = list(self._pending.values()) + self._queued
+                self._pending.clear()
+                self._queued = []
+            self._fail(requests, RTSPNetError('Connection closed'))
 
     def run(self):
         try:
             while self.running:
-                self.response = msg = self.recv_msg()
-                if msg.startswith('RTSP'):
-                    self._process_response(msg)
-                elif msg.startswith('ANNOUNCE'):
-                    self._process_announce(msg)
+                msg = self.recv_msg()
+                if msg is not None:
+                    self._dispatch(msg)
         except Exception as e:
             raise RTSPError('Run time error: %s' % e)
-        self.running = False
-        self.close()
+        finally:
+            self.running = False
+            self.close()
 
-    def _parse_url(self, url):
-        '''Resolve url, return the urlparse object'''
-        parsed = urlparse(url)
-        scheme = parsed.scheme.lower()
-        ip = parsed.hostname
-        port = parsed.port and int(parsed.port) or DEFAULT_SERVER_PORT
-        target = parsed.path
-        if parsed.query:
-            target += '?' + parsed.query
-        if parsed.fragment:
-            target += '#' + parsed.fragment
+    def _dispatch(self, msg):
+        self.response = msg
+        if msg.start_line.startswith('RTSP'):
+            self._process_response(msg)
+        elif msg.start_line.startswith('ANNOUNCE'):
+            self._process_announce(msg)
 
-        if not scheme:
-            raise RTSPURLError('Bad URL "%s"' % url)
-        if scheme not in ('rtsp',): # 'rtspu'):
-            raise RTSPURLError('Unsupported scheme "%s" \
-                                in URL "%s"' % (scheme, url))
-        if not ip or not target:
-            raise RTSPURLError('Invalid url: %s (host="%s" \
-                                port=%u target="%s")' %
-                                (url, ip, port, target))
-        return parsed
+    def _on_readable(self):
+        '''Called from the RTSPEngine thread when the socket has data'''
+        try:
+            more = self._sock.recv(RECV_BUFFER_SIZE)
+        except socket.error as e:
+            self._callback('Receive data error: %s' % e)
+            more = b''
+        if not more: # Connection closed
+            self.close()
+            return
+        self._framer.feed(more)
+        while self.running:
+            msg = self._framer.next_msg()
+            if msg is None:
+                break
+            self._dispatch(msg)
+        if not self.running:
+            self.close()
+
+    def _call_later(self, delay, fn):
+        if self._engine:
+            self._engine.call_later(delay, fn)
+        else:
+            threading.Timer(delay, fn).start()
 
     def _connect_server(self):
         '''Connect to the server and create a socket'''
         try:
-            self._sock = self._socks or socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._sock.connect((self._parsed_url.hostname, self._server_port))
+            if self._socks:
+                self._sock = self._socks
+                self._sock.settimeout(self.connect_timeout)
+                self._sock.connect((self._parsed_url.hostname, self._server_port))
+            else:
+                self._sock = connect_tcp(self._parsed_url.hostname, self._server_port,
+                                         self.connect_timeout)
+            self._sock.settimeout(self.timeout)
         except socket.error as e:
             raise RTSPNetError('socket error: %s [%s:%d]' % 
                             (e, self._parsed_url.hostname, self._server_port))
 
-    def _update_content_base(self, msg):
-        m = re.search(r'[Cc]ontent-[Bb]ase:\s?(?P<base>[a-zA-Z0-9_:\/\.]+)', msg)
-        if (m and m.group('base')):
-            new_url = m.group('base')
-            if new_url[-1] == '/':
-                new_url = new_url[:-1]
-            self._orig_url = new_url
-
     def _update_dest_ip(self):
         '''If DEST_IP is not specified, 
            by default the same IP is used as this RTSP client'''
@@ -169,199 +717,152 @@ class RTSPClient(threading.Thread):
 
     def recv_msg(self):
         '''A complete response message or 
-           an ANNOUNCE notification message is received'''
+           an ANNOUNCE notification message is received, as an RTSPMessage,
+           None once the connection ends.
+           Interleaved binary data in between is handed to the
+           interleaved callback'''
         try:
-            while not (not self.running or HEADER_END_STR in self.cache()):
-                more = self._sock.recv(2048)
-                if not more:
+            while self.running:
+                msg = self._framer.next_msg()
+                if msg is not None:
+                    return msg
+                try:
+                    more = self._sock.recv(RECV_BUFFER_SIZE)
+                except socket.timeout:
+                    if self._overdue():
+                        raise
+                    continue # Idle, nothing is waiting for an answer
+                if not more: # Connection closed by the server
+                    self.running = False
                     break
-                self.cache(more.decode())
+                self._framer.feed(more)
         except socket.error as e:
-            RTSPNetError('Receive data error: %s' % e)
-
-        msg = ''
-        if self.cache():
-            tmp = self.cache()
-            try:
-            	(msg, tmp) = tmp.split(HEADER_END_STR, 1)
-            except ValueError as e:
-            	self._callback(self._get_time_str() + '\n' + tmp)
-            	raise RTSPError('Response did not contain double CRLF')
-            content_length = self._get_content_length(msg)
-            msg += HEADER_END_STR + tmp[:content_length]
-            self.set_cache(tmp[content_length:])
-        return msg
-
-    def _add_auth(self, msg):
-        '''Authentication request string 
-           (i.e. everything after "www-authentication")'''
-        #TODO: this is too simplistic and will fail if more than one method
-        #       is acceptable, among other issues
-        if msg.lower().startswith('basic'):
-            pass
-        elif msg.lower().startswith('digest '):
-            mod_msg = '{'+msg[7:].replace('=',':')+'}'
-            mod_msg = mod_msg.replace('realm','"realm"')
-            mod_msg = mod_msg.replace('nonce','"nonce"')
-            msg_dict = ast.literal_eval(mod_msg)
-            response = self._auth_digest(msg_dict)
-            auth_string = 'Digest ' \
-                          'username="{}", ' \
-                          'algorithm="MD5", ' \
-                          'realm="{}", ' \
-                          'nonce="{}", ' \
-                          'uri="{}", ' \
-                          'response="{}"'.format(
-                          self._parsed_url.username,
-                          msg_dict['realm'],
-                          msg_dict['nonce'],
-                          self._parsed_url.path,
-                          response)
-            self._auth = auth_string
-        else: # Some other failure
-            self.do_teardown()
-            raise RTSPError('Authentication failure')
-
-    def _auth_digest(self, auth_parameters):
-        '''Creates a response string for digest authorization, only works
-           with the MD5 algorithm at the moment'''
-        #TODO expand to more than MD5
-        if self._parsed_url.username:
-            HA1 = md5("{}:{}:{}".format(self._parsed_url.username,
-                                        auth_parameters['realm'],
-                                        self._parsed_url.password).encode()
-                                        ).hexdigest()
-            HA2 = md5("{}:{}".format(self._cseq_map[self._cseq],
-                                     self._parsed_url.path).encode()
-                                     ).hexdigest()
-            response = md5("{}:{}:{}".format(HA1,
-                                             auth_parameters['nonce'],
-                                             HA2).encode()).hexdigest()
-            return response
-        else:
-            self.do_teardown()
-            raise RTSPError('Authentication required, no username provided')
-
-    def _get_content_length(self, msg):
-        '''Content-length is parsed from the message'''
-        m = re.search(r'content-length:\s?(?P<len>\d+)', msg.lower(), re.S)
-        return (m and int(m.group('len'))) or 0
+            self.running = False
+            self._callback('Receive data error: %s' % e)
+        return None
 
-    def _get_time_str(self):
-        '''Python 2.6 and above only supports %f parameters,
-           compatible with the lower version with the following wording'''
-        dt = datetime.datetime.now()
-        return dt.strftime('%Y-%m-%d %H:%M:%S.') + str(dt.microsecond)
+    def _overdue(self):
+        '''True when a request has waited timeout seconds for its answer'''
+        now = time.monotonic()
+        with self._lock:
+            return any(now - request.sent >= self.timeout for request in self._pending.values())
 
     def _process_response(self, msg):
-        '''Process the response message'''
+        '''Process the response message, resolving the request with its CSeq'''
         status, headers, body = self._parse_response(msg)
         rsp_cseq = int(headers['cseq'])
-        
-        if self._cseq_map[rsp_cseq] != 'GET_PARAMETER':
-            self._callback(self._get_time_str() + '\n' + msg)
-        
-        if status == 401 and not self._auth:
-            self._add_auth(headers['www-authenticate'])
-            self.do_replay_request()
+        with self._lock:
+            request = self._pending.pop(rsp_cseq, None)
+            establishing = rsp_cseq == self._setup_cseq
+            if establishing:
+                self._setup_cseq = None
+        if request is None: # Unknown CSeq
+            self._callback(self._get_time_str() + '\n' + str(msg))
+            return
+        if request.method != 'GET_PARAMETER':
+            self._callback(self._get_time_str() + '\n' + str(msg))
+
+        retry = False
+        if status == 401 and not request.replay:
+            try:
+                retry = self._add_auth(headers.get('www-authenticate', ''), request.signed)
+            except RTSPError as e:
+                self._callback('%s' % e)
+        if retry:
+            # The original request completes with the replayed one
+            replay = self._sendmsg(request.method, request.url, request.headers, replay=True)
+            replay.add_done_callback(lambda f, target=request.future: _chain_future(f, target))
         elif status == 302:
             self.location = headers['location']
+        elif status != 200 and request.method in ('GET_PARAMETER', 'OPTIONS'):
+            # A failed keepalive doesn't end the session
+            if status in (405, 501) and request.method == 'GET_PARAMETER':
+                self._keepalive_method = 'OPTIONS'
         elif status != 200:
             self.do_teardown()
-        elif self._cseq_map[rsp_cseq] == 'DESCRIBE': #Implies status 200
-            self._update_content_base(msg)
+        elif request.method == 'DESCRIBE': #Implies status 200
+            self._update_content_base(headers)
             self._parse_track_id(body)
             self.state = 'describe'
             if self.choose_transport:
                 self.TRANSPORT_TYPE_LIST = self.choose_transport(body)
-        elif self._cseq_map[rsp_cseq] == 'SETUP':
-            self._session_id = headers['session']
-            self.send_heart_beat_msg()
+        elif request.method == 'SETUP':
+            if not self._session_id:
+                self._session_id = headers['session'].split(';')[0]
+                self._call_later(self.HEARTBEAT_INTERVAL, self.send_heart_beat_msg)
             self.state = 'setup'
-        elif self._cseq_map[rsp_cseq] == 'PLAY':
+        elif request.method == 'PLAY':
             self.state = 'play'
-        else:
-            pass
-            #print(msg)
+        if establishing:
+            self._release_queued()
+        if not retry and not request.future.done():
+            request.future.set_result(RTSPResponse(status, headers, body))
+
+    def _release_queued(self):
+        '''The first SETUP got its answer: sends everything queued behind it
+           in one write, or fails it if no session came out of the SETUP'''
+        with self._lock:
+            if self._setup_cseq is not None: # Replayed after a 401, still waiting
+                return
+            queued, self._queued = self._queued, []
+            if queued and self._session_id:
+                self._send(queued)
+                return
+        self._fail(queued, RTSPError('SETUP failed, no session'))
+
+    def _fail(self, requests, error):
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(error)
 
     def _process_announce(self, msg):
         '''Processes the ANNOUNCE notification message'''
-        self._callback(msg)
-        headers = self._parse_header_params(msg.splitlines()[1:])
-        x_notice_val = int(headers['x-notice'])
+        self._callback(str(msg))
+        x_notice_val = int(msg.headers['x-notice'])
         if x_notice_val in (X_NOTICE_EOS, X_NOTICE_BOS):
             self.cur_scale = 1
             self.do_play(self.cur_range, self.cur_scale)
         elif x_notice_val == X_NOTICE_CLOSE:
             self.do_teardown()
 
-    def _parse_response(self, msg):
-        '''Resolve the response message'''
-        header, body = msg.split(HEADER_END_STR)[:2]
-        header_lines = header.splitlines()
-        version, status = header_lines[0].split(None, 2)[:2]
-        headers = self._parse_header_params(header_lines[1:])
-        return int(status), headers, body
-
-    def _parse_header_params(self, header_param_lines):
-        '''Parse header parameters'''
-        headers = {}
-        for line in header_param_lines:
-            if line.strip():
-                key, val = line.split(':', 1)
-                headers[key.lower()] = val.strip()
-        return headers
-
-    def _parse_track_id(self, sdp):
-        '''Resolves a string of the form trackID = 2 from sdp'''
-        m = re.findall(r'a=control:(?P<trackid>[\w=\d]+)', sdp, re.S)
-        #m = re.findall(r'a=control:\w+(?P<trackid>[\d]+)', sdp, re.S)
-        self.track_id_lst = m
-
-    def _next_seq(self):
-        self._cseq += 1
-        return self._cseq
+    def _sendmsg(self, method, url, headers, replay=False):
+        '''Sends a request without waiting for earlier ones to be answered,
+           returns a Future resolved with its RTSPResponse. While the SETUP
+           creating the session is in flight, requests needing the session
+           are held back and sent together once it is known'''
+        request = RTSPRequest(method, url, headers, Future(), replay)
+        with self._lock:
+            if self._setup_cseq is not None and method in SESSION_METHODS:
+                self._queued.append(request)
+            else:
+                self._send([request])
+        return request.future
 
-    def _sendmsg(self, method, url, headers):
-        '''Send a message'''
-        self.flush() # clear recv buffer
-        msg = '%s %s %s'%(method, url, RTSP_VERSION)
-        headers['User-Agent'] = DEFAULT_USERAGENT
-        cseq = self._next_seq()
-        self._cseq_map[cseq] = method
-        headers['CSeq'] = str(cseq)
-        if self._session_id:
-            headers['Session'] = self._session_id
-        for (k, v) in list(headers.items()):
-            msg += END_OF_LINE + '%s: %s'%(k, str(v))
-        msg += HEADER_END_STR # End headers
-        if method != 'GET_PARAMETER' or 'x-RetransSeq' in headers:
-            self._callback(self._get_time_str() + END_OF_LINE + msg)
+    def _send(self, requests):
+        '''Writes requests back to back, the caller holds self._lock'''
+        cseqs, msgs = [], []
+        for request in requests:
+            # The stored headers are reused as is if the request is replayed
+            cseq, msg, signed = self._format_request(request.method, request.url,
+                                                     dict(request.headers))
+            if request.method == 'SETUP' and not self._session_id:
+                self._setup_cseq = cseq
+            self._pending[cseq] = request._replace(signed=signed, sent=time.monotonic())
+            cseqs.append(cseq)
+            msgs.append(msg)
+            if request.method != 'GET_PARAMETER' or 'x-RetransSeq' in request.headers:
+                self._callback(self._get_time_str() + END_OF_LINE + msg)
         try:
-            self._sock.send(msg.encode())
+            self._sock.sendall(''.join(msgs).encode())
         except socket.error as e:
+            for cseq in cseqs:
+                self._pending.pop(cseq, None)
+            self._fail(requests, RTSPNetError(e))
             self._callback('Send msg error: %s'%e)
             raise RTSPNetError(e)
 
-    def _get_transport_type(self):
-        '''The Transport string parameter that is required to get SETUP'''
-        transport_str = ''
-        ip_type = 'unicast' #TODO: if IPAddress(DEST_IP).is_unicast() 
-                            #      else 'multicast'
-        for t in self.TRANSPORT_TYPE_LIST:
-            if t not in TRANSPORT_TYPE_MAP:
-                raise RTSPError('Error param: %s' % t)
-            if t.endswith('tcp'):
-                transport_str +=TRANSPORT_TYPE_MAP[t]%ip_type
-            else:
-                transport_str +=TRANSPORT_TYPE_MAP[t]%(ip_type, 
-                                                       self._dest_ip, 
-                                                       self.CLIENT_PORT_RANGE)
-        return transport_str
-
-    def do_describe(self, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
+    def do_describe(self, headers=None):
+        headers = dict(headers or {})
         headers['Accept'] = 'application/sdp'
         if self.ENABLE_ARQ:
             headers['x-Retrans'] = 'yes'
@@ -370,75 +871,58 @@ class RTSPClient(threading.Thread):
             headers['x-zmssFecCDN'] = 'yes'
         if self.NAT_IP_PORT: 
             headers['x-NAT'] = self.NAT_IP_PORT
-        self._sendmsg('DESCRIBE', self._orig_url, headers)
+        return self._sendmsg('DESCRIBE', self._orig_url, headers)
 
-    def do_setup(self, track_id_str=None, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
+    def do_setup(self, track_id_str=None, headers=None):
+        headers = dict(headers or {})
         headers['Transport'] = self._get_transport_type()
         #TODO: Currently issues SETUP for all tracks but doesn't keep track 
         # of all sessions or teardown all of them.
         if isinstance(track_id_str,str):
-            self._sendmsg('SETUP', self._orig_url+'/'+track_id_str, headers)
+            return self._sendmsg('SETUP', self._orig_url+'/'+track_id_str, headers)
         elif isinstance(track_id_str, int):
-            self._sendmsg('SETUP', self._orig_url + '/' +
+            return self._sendmsg('SETUP', self._orig_url + '/' +
                                    self.track_id_lst[track_id_str], headers)
         elif self.track_id_lst:
+            # Only the first SETUP waits for its reply, the session it creates
+            # is needed by the others. They go out in one write with whatever
+            # was requested meanwhile, e.g. PLAY. The last one completes them all
             for track in self.track_id_lst:
-                self._sendmsg('SETUP', self._orig_url+'/'+track, headers)
+                future = self._sendmsg('SETUP', self._orig_url+'/'+track, headers)
+            return future
         else:
-            self._sendmsg('SETUP', self._orig_url, headers)
+            return self._sendmsg('SETUP', self._orig_url, headers)
 
-    def do_play(self, range='npt=end-', scale=1, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
+    def do_play(self, range='npt=end-', scale=1, headers=None):
+        headers = dict(headers or {})
         headers['Range'] = range
         headers['Scale'] = scale
-        self._sendmsg('PLAY', self._orig_url, headers)
+        return self._sendmsg('PLAY', self._orig_url, headers)
 
-    def do_pause(self, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
-        self._sendmsg('PAUSE', self._orig_url, headers)
+    def do_pause(self, headers=None):
+        headers = dict(headers or {})
+        return self._sendmsg('PAUSE', self._orig_url, headers)
 
-    def do_teardown(self, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
-        self._sendmsg('TEARDOWN', self._orig_url, headers)
+    def do_teardown(self, headers=None):
+        headers = dict(headers or {})
+        future = self._sendmsg('TEARDOWN', self._orig_url, headers)
         self.running = False
+        return future
 
-    def do_options(self, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
-        self._sendmsg('OPTIONS', self._orig_url, headers)
-
-    def do_get_parameter(self, headers={}):
-        if self._auth:
-            headers['Authorization'] = self._auth
-        self._sendmsg('GET_PARAMETER', self._orig_url, headers)
-
-    def do_replay_request(self, headers={}):
-        if self._cseq_map[self._cseq] == 'DESCRIBE':
-            self.do_describe()
-        elif self._cseq_map[self._cseq] == 'SETUP':
-            self.do_setup()
-        elif self._cseq_map[self._cseq] == 'PLAY':
-            self.do_play()
-        elif self._cseq_map[self._cseq] == 'PAUSE':
-            self.do_pause()
-        elif self._cseq_map[self._cseq] == 'TEARDOWN':
-            self.do_teardown()
-        elif self._cseq_map[self._cseq] == 'OPTIONS':
-            self.do_options()
-        elif self._cseq_map[self._cseq] == 'GET_PARAMETER':
-            self.do_get_parameter()
+    def do_options(self, headers=None):
+        headers = dict(headers or {})
+        return self._sendmsg('OPTIONS', self._orig_url, headers)
+
+    def do_get_parameter(self, headers=None):
+        headers = dict(headers or {})
+        return self._sendmsg('GET_PARAMETER', self._orig_url, headers)
 
     def send_heart_beat_msg(self):
-        '''Timed sending GET_PARAMETER message keep alive'''
-        if not self.running:
-            self.do_get_parameter()
-            threading.Timer(self.HEARTBEAT_INTERVAL, 
-                            self.send_heart_beat_msg).start()
+        '''Timed sending GET_PARAMETER message keep alive, OPTIONS once the
+           server answered GET_PARAMETER with 405 or 501'''
+        if self.running:
+            self._sendmsg(self._keepalive_method, self._orig_url, {})
+            self._call_later(self.HEARTBEAT_INTERVAL, self.send_heart_beat_msg)
 
     def ping(self, timeout=0.01):
         '''No exceptions == service available'''
@@ -446,3 +930,194 @@ class RTSPClient(threading.Thread):
         time.sleep(timeout)
         self.close()
         return self.response
+
+# Python 3.8+ races the resolved addresses itself
+HAPPY_EYEBALLS_KWARGS = {'happy_eyeballs_delay': HAPPY_EYEBALLS_DELAY} \
+                        if sys.version_info >= (3, 8) else {}
+
+class AsyncRTSPClient(asyncio.Protocol, RTSPClientBase):
+    '''asyncio counterpart of RTSPClient: the connection is driven by the
+       event loop and every request is a coroutine returning its
+       RTSPResponse. connect_timeout bounds the TCP connect, timeout each
+       request, so many clients can be awaited concurrently on one loop'''
+    def __init__(self, url, dest_ip='', callback=None, choose_transport=None,
+                 interleaved_callback=None, connect_timeout=10, timeout=10, loop=None):
+        self._loop        = loop or asyncio.get_event_loop()
+        self._callback    = callback or (lambda x: x)
+        self._cseq        = 0
+        self._pending     = {} # {CSeq:asyncio.Future} resolved with an RTSPResponse
+        self._dest_ip     = dest_ip
+        self._parsed_url  = self._parse_url(url)
+        self._server_port = self._parsed_url.port or DEFAULT_SERVER_PORT
+        self._orig_url    = self._parsed_url.scheme + "://" + \
+                            self._parsed_url.hostname + \
+                            ":" + str(self._server_port) + \
+                            self._parsed_url.path
+        self._challenge   = self._cached_challenge()
+        self._session_id  = ''
+        self._transport   = None
+        self._framer      = RTSPFramer(interleaved_callback)
+        self.connect_timeout = connect_timeout
+        self.timeout      = timeout
+        self.cur_range    = 'npt=end-'
+        self.cur_scale    = 1
+        self.choose_transport = choose_transport
+        self.track_id_lst = []
+        self.closed       = False
+        self.keepalive_missed = 0 # Consecutive keepalives without a reply
+        self._keepalive   = None
+        if '.sdp' not in self._parsed_url.path.lower():
+            self.cur_range = 'npt=0.00000-' # On demand starts from the beginning
+
+    async def connect(self):
+        await asyncio.wait_for(self._loop.create_connection(lambda: self,
+                                                            self._parsed_url.hostname,
+                                                            self._server_port,
+                                                            **HAPPY_EYEBALLS_KWARGS),
+                               self.connect_timeout)
+        if not self._dest_ip:
+            self._dest_ip = self._transport.get_extra_info('sockname')[0]
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self._keepalive:
+            self._keepalive.cancel()
+        if self._transport and not self.closed:
+            self._transport.close()
+        self.closed = True
+
+    async def wait_closed(self):
+        '''Waits for the keepalive task stopped by close() to end'''
+        if self._keepalive:
+            await asyncio.wait([self._keepalive])
+
+    def start_keepalive(self, interval=None):
+        '''Keeps the connection and session alive with GET_PARAMETER every
+           interval seconds, OPTIONS if the server refuses GET_PARAMETER.
+           Keepalives unanswered or answered with an error are counted in
+           keepalive_missed, until the next 2xx'''
+        if self._keepalive is None and not self.closed:
+            self._keepalive = asyncio.ensure_future(
+                self._keepalive_loop(interval or self.HEARTBEAT_INTERVAL), loop=self._loop)
+
+    async def _keepalive_loop(self, interval):
+        method = 'GET_PARAMETER'
+        while not self.closed:
+            await asyncio.sleep(interval)
+            try:
+                response = await self.request(method)
+            except asyncio.TimeoutError:
+                self.keepalive_missed += 1
+                continue
+            except RTSPError: # Connection lost
+                break
+            if response.status in (405, 501) and method == 'GET_PARAMETER':
+                method = 'OPTIONS'
+            elif 200 <= response.status < 300:
+                self.keepalive_missed = 0
+            else:
+                self.keepalive_missed += 1
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def data_received(self, data):
+        self._framer.feed(data)
+        while True:
+            msg = self._framer.next_msg()
+            if msg is None:
+                break
+            if msg.start_line.startswith('RTSP'):
+                self._process_response(msg)
+            else: # ANNOUNCE and other server requests
+                self._callback(str(msg))
+
+    def connection_lost(self, exc):
+        self.closed = True
+        while self._pending:
+            cseq, future = self._pending.popitem()
+            if not future.done():
+                future.set_exception(RTSPNetError(exc or 'Connection closed'))
+
+    def _process_response(self, msg):
+        status, headers, body = self._parse_response(msg)
+        future = self._pending.pop(int(headers.get('cseq', -1)), None)
+        if future and not future.done():
+            future.set_result(RTSPResponse(status, headers, body))
+
+    async def request(self, method, url=None, headers=None):
+        '''Sends a request and waits for its response, answering a digest
+           challenge once'''
+        response, signed = await self._request(method, url, headers)
+        if response.status == 401 and \
+                self._add_auth(response.headers.get('www-authenticate', ''), signed):
+            response, signed = await self._request(method, url, headers)
+        return response
+
+    async def _request(self, method, url, headers):
+        if self.closed:
+            raise RTSPNetError('Connection closed')
+        headers = dict(headers or {})
+        cseq, msg, signed = self._format_request(method, url or self._orig_url, headers)
+        future = self._pending[cseq] = self._loop.create_future()
+        self._transport.write(msg.encode())
+        try:
+            return await asyncio.wait_for(future, self.timeout), signed
+        finally:
+            self._pending.pop(cseq, None)
+
+    async def options(self):
+        return await self.request('OPTIONS')
+
+    async def describe(self):
+        headers = {'Accept': 'application/sdp'}
+        response = await self.request('DESCRIBE', headers=headers)
+        if response.status == 200:
+            self._update_content_base(response.headers)
+            self._parse_track_id(response.body)
+            if self.choose_transport:
+                self.TRANSPORT_TYPE_LIST = self.choose_transport(response.body)
+        return response
+
+    async def setup(self, track_id=None):
+        '''SETUP one track, by control string or index into track_id_lst,
+           or every track described when track_id is None'''
+        if isinstance(track_id, int):
+            track_id = self.track_id_lst[track_id]
+        if track_id is not None:
+            tracks = [track_id]
+        else:
+            tracks = self.track_id_lst or ['']
+        headers = {'Transport': self._get_transport_type()}
+        urls = [self._orig_url + '/' + track if track else self._orig_url for track in tracks]
+        if not self._session_id:
+            # The session created by the first SETUP is needed by the others
+            response = await self.request('SETUP', urls.pop(0), headers)
+            if response.status != 200:
+                return response
+            self._session_id = response.headers['session'].split(';')[0]
+        # The remaining tracks are pipelined
+        for response in await asyncio.gather(*[self.request('SETUP', url, headers)
+                                               for url in urls]):
+            if response.status != 200:
+                break
+        return response
+
+    async def play(self, range=None, scale=None):
+        return await self.request('PLAY', headers={'Range': range or self.cur_range,
+                                                   'Scale': scale or self.cur_scale})
+
+    async def get_parameter(self):
+        return await self.request('GET_PARAMETER')
+
+    async def teardown(self):
+        try:
+            return await self.request('TEARDOWN')
+        finally:
+            self.close()
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*-coding=utf-8
+from __future__ import print_function, division
+import asyncio
+import datetime
+import gc
+import os
+import sys
+import tracemalloc
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera import Camera, Profile
+
+SOAK_CYCLES = 10000
+
+
+class Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeMedia(object):
+    '''Answers like a 3 profile camera, without the network'''
+
+    def GetProfiles(self):
+        vec = Obj(Encoding='H264', Quality=4.0,
+                  Resolution=Obj(Width=1280, Height=720),
+                  RateControl=Obj(FrameRateLimit=25, EncodingInterval=1,
+                                  BitrateLimit=2048))
+        return [Obj(Name='Profile%d' % i, token='token%d' % i,
+                    VideoEncoderConfiguration=vec) for i in range(3)]
+
+    def __init__(self):
+        self.base = 'rtsp://192.168.0.102:10554/'
+        self.stream_uri_calls = 0
+
+    def GetStreamUri(self, params):
+        self.stream_uri_calls += 1
+        return {'Uri': self.base + params['ProfileToken'],
+                'InvalidAfterConnect': False, 'InvalidAfterReboot': True,
+                'Timeout': datetime.timedelta(seconds=0)}
+
+
+class FakeDeviceMgmt(object):
+    def __init__(self):
+        self.clock_shift = datetime.timedelta(0)
+
+    def GetCapabilities(self):
+        return {'Imaging': None, 'Media': {'XAddr': 'http://192.168.0.102/onvif/media'}}
+
+    def GetSystemDateAndTime(self):
+        now = datetime.datetime.now(datetime.timezone.utc) + self.clock_shift
+        return Obj(UTCDateTime=Obj(Date=Obj(Year=now.year, Month=now.month, Day=now.day),
+                                   Time=Obj(Hour=now.hour, Minute=now.minute,
+                                            Second=now.second)),
+                   LocalDateTime=None)
+
+
+class FakeONVIFCamera(object):
+    def __init__(self):
+        self.devicemgmt = FakeDeviceMgmt()
+        self.media = FakeMedia()
+
+    def get_service(self, name):
+        return getattr(self, name)
+
+
+class TestProfiles(unittest.TestCase):
+
+    def setUp(self):
+        self.cam = Camera(ip='192.168.0.102', onvif='10080',
+                          username='admin', password='admin')
+        self.cam.camera = FakeONVIFCamera()
+
+    def probe(self):
+        # Forces GetProfiles/GetStreamUri like a probe with an expired cache
+        self.cam.invalidate_media()
+        self.cam.probe_information()
+
+    def test_profiles_replaced(self):
+        self.probe()
+        first = self.cam.profiles
+        self.probe()
+        self.assertEqual(len(self.cam.profiles), 3)
+        self.assertIsNot(first, self.cam.profiles)
+        self.assertEqual(self.cam.profiles[2].rtsp_uri, 'rtsp://192.168.0.102:10554/token2')
+
+    def test_clock_jump_refetches_stream_uris(self):
+        self.cam.probe_information()
+        media = self.cam.camera.media
+        self.assertFalse(self.cam.probe_information()) # PT0S: cached until the profiles change
+        self.assertEqual(media.stream_uri_calls, 3)
+        self.cam.camera.devicemgmt.clock_shift = -datetime.timedelta(days=365)
+        self.assertTrue(self.cam.probe_information())
+        self.assertEqual(media.stream_uri_calls, 6)
+
+    def test_stale_stream_uri_checked_again(self):
+        described = []
+        async def check_describe(uri):
+            described.append(uri)
+            return uri.startswith(self.cam.camera.media.base)
+        self.cam.check_describe = check_describe
+        self.cam.probe_information()
+        self.cam.camera.media.base = 'rtsp://192.168.0.102:554/' # Profiles changed
+        loop = asyncio.new_event_loop()
+        try:
+            condition = loop.run_until_complete(self.cam.full_check())
+        finally:
+            loop.close()
+        self.assertIn(Camera.RTSP_HEALTHY, condition)
+        self.assertEqual(described, ['rtsp://192.168.0.102:10554/token0',
+                                     'rtsp://192.168.0.102:554/token0'])
+
+    def test_profile_slots(self):
+        self.assertFalse(hasattr(Profile(), '__dict__'))
+
+    def test_soak_memory_flat(self):
+        for i in range(100):
+            self.probe()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(SOAK_CYCLES):
+                self.probe()
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # Old behaviour grew by 3 Profiles (~1.5 KiB) per cycle
+        self.assertLess(after - before, 64 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*-coding=utf-8
+from __future__ import print_function, division
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'python-rtsp-client'))
+
+from rtp import (FrameInfo, H264Depacketizer, H265Depacketizer, ReorderBuffer, RTPReceive,
+                 START_CODE, get_depacketizer, parse_rtp)
+
+
+def packet(seq, payload, timestamp=3600, marker=False):
+    return struct.pack('!BBHII', 0x80, 96 | (0x80 if marker else 0), seq, timestamp,
+                       0x1234) + payload
+
+
+class DepacketizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = []
+
+    def depacketizer(self, cls):
+        return cls(lambda frame: self.frames.append(bytes(frame)))
+
+    def test_h264_stap_a_and_fu_a(self):
+        d = self.depacketizer(H264Depacketizer)
+        sps, pps, idr = b'\x67\x42\x00', b'\x68\xce', b'\x65' + b'\xaa' * 6
+        stap = b'\x18' + struct.pack('!H', len(sps)) + sps + struct.pack('!H', len(pps)) + pps
+        self.assertIsNone(d.process_packet(packet(1, stap)))
+        d.process_packet(packet(2, b'\x7c\x85' + idr[1:4]))
+        info = d.process_packet(packet(3, b'\x7c\x45' + idr[4:], marker=True))
+        self.assertEqual(info, FrameInfo(True, 3600))
+        self.assertEqual(self.frames, [START_CODE + sps + START_CODE + pps + START_CODE + idr])
+
+    def test_h264_fu_a_gap_drops_the_fragmented_unit(self):
+        d = self.depacketizer(H264Depacketizer)
+        d.process_packet(packet(1, b'\x06\x05'))
+        d.process_packet(packet(2, b'\x7c\x85\x01'))
+        d.process_packet(packet(4, b'\x7c\x45\x03'))
+        info = d.process_packet(packet(5, b'\x41\x9a', timestamp=7200, marker=True))
+        self.assertEqual(self.frames, [START_CODE + b'\x06\x05', START_CODE + b'\x41\x9a'])
+        self.assertEqual(info, FrameInfo(False, 7200))
+
+    def test_h265_aggregation_and_fragmentation(self):
+        d = self.depacketizer(H265Depacketizer)
+        vps, sps = b'\x40\x01\x0c', b'\x42\x01\x01'
+        ap = b'\x60\x01' + struct.pack('!H', len(vps)) + vps + struct.pack('!H', len(sps)) + sps
+        d.process_packet(packet(65535, ap))
+        d.process_packet(packet(0, b'\x62\x01\x93\xaa'))
+        info = d.process_packet(packet(1, b'\x62\x01\x53\xbb', marker=True))
+        self.assertTrue(info.keyframe)
+        self.assertEqual(self.frames, [START_CODE + vps + START_CODE + sps +
+                                       START_CODE + b'\x26\x01\xaa\xbb'])
+
+    def test_codec_from_sdp(self):
+        sdp = 'm=audio 0 RTP/AVP 0\r\na=rtpmap:0 PCMU/8000\r\n' \
+              'm=video 0 RTP/AVP 98\r\na=rtpmap:98 H265/90000\r\n'
+        self.assertIsInstance(get_depacketizer(sdp), H265Depacketizer)
+        self.assertIsInstance(get_depacketizer(None), H264Depacketizer)
+
+
+class ReorderBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.out = []
+        self.buffer = ReorderBuffer(lambda header, payload: self.out.append(header.sequence),
+                                    size=8, latency=0.05, clock=lambda: self.now)
+
+    def push(self, *sequences):
+        for seq in sequences:
+            self.buffer.push(*parse_rtp(packet(seq, b'\x41')))
+
+    def test_reorders_across_wraparound(self):
+        self.push(65534, 0, 65535, 2, 1)
+        self.assertEqual(self.out, [65534, 65535, 0, 1, 2])
+        self.assertEqual((self.buffer.lost, len(self.buffer)), (0, 0))
+
+    def test_duplicate_late_and_lost(self):
+        self.push(10, 12, 10, 12)
+        self.assertEqual(self.buffer.duplicate, 2)
+        self.now = 0.1
+        self.push(13)
+        self.assertEqual(self.out, [10, 12, 13])
+        self.push(11)
+        self.assertEqual((self.buffer.lost, self.buffer.late, self.buffer.received), (1, 1, 6))
+
+    def test_full_buffer_gives_up_on_missing(self):
+        self.push(100, *range(102, 111))
+        self.assertEqual(self.out, [100] + list(range(102, 111)))
+        self.assertEqual(self.buffer.lost, 1)
+
+
+class RTPReceiveTest(unittest.TestCase):
+
+    def test_udp_burst_out_of_order(self):
+        frames, done = [], threading.Event()
+        def on_frame(frame):
+            frames.append(bytes(frame))
+            done.set()
+        rtp = RTPReceive([0], callback=on_frame, timeout=1)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        address = ('127.0.0.1', rtp._sock.getsockname()[1])
+        try:
+            for seq, payload, marker in ((1, b'\x67\x42', False), (3, b'\x7c\x45\x02', True),
+                                         (2, b'\x7c\x85\x01', False)):
+                sender.sendto(packet(seq, payload, marker=marker), address)
+            self.assertTrue(done.wait(2))
+        finally:
+            sender.close()
+            rtp.close()
+            rtp.join()
+        self.assertEqual(frames, [START_CODE + b'\x67\x42' + START_CODE + b'\x65\x01\x02'])
+        self.assertEqual((rtp.reorder.received, rtp.reorder.lost), (3, 0))
+
+    def test_close_wakes_and_flushes(self):
+        frames = []
+        rtp = RTPReceive([0], callback=lambda frame: frames.append(bytes(frame)), timeout=None)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sender.sendto(packet(1, b'\x67\x42'), ('127.0.0.1', rtp._sock.getsockname()[1]))
+            deadline = time.time() + 2
+            while not rtp.reorder.received and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            sender.close()
+            rtp.close()
+            rtp.join(1)
+        self.assertFalse(rtp.is_alive())
+        self.assertEqual(frames, [START_CODE + b'\x67\x42'])
+        self.assertEqual(rtp._sock.fileno(), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()